@@ -0,0 +1,146 @@
+"""Cross-worker cache coherence through a shared-memory version counter.
+
+With several uvicorn workers, each process holds its own caches: the player
+catalog, theme eligibility, the search index, rankings and the daily theme.
+`SharedCounters` keeps one 64-bit version per collection in a small file that
+is memory-mapped by every worker on the host, by default in /dev/shm. Writers
+increment a counter under an exclusive `flock`, and readers map the file and
+read it without locking.
+
+`CoherenceMiddleware` compares the shared counters with the versions the
+worker last adopted before each request. For every collection that another
+worker changed, it invalidates the local caches. The check costs a few mmap
+reads per request and no network round trip.
+
+Vote counts change far more often than anything else, and dropping every
+ranking on each vote would send the next read of every board to Mongo.
+`SharedVoteLog` is a ring of the latest `(formation, theme, votes)` records in
+another mapped file. A worker that re-ranks a formation appends to it before
+bumping the `formations` counter, so the other workers apply the new counts
+to their boards instead of discarding them.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from typing import Callable, Iterable, List, Optional, Tuple
+
+EPOCH_SIZE = 16
+SLOT = struct.Struct("<Q")
+LOG_HEAD = struct.Struct("<Q")  # sequence number of the last record
+LOG_RECORD = struct.Struct("<QQ8s36s4x")  # sequence, votes, theme hash, formation id
+
+
+def default_path(name: str = "dream11-versions") -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, name)
+
+
+def theme_hash(theme: Optional[str]) -> bytes:
+    return hashlib.blake2b((theme or "").encode(), digest_size=8).digest()
+
+
+class SharedCounters:
+    def __init__(self, path: str, names: Iterable[str]):
+        self.path = path
+        self._offsets = {name: EPOCH_SIZE + i * SLOT.size for i, name in enumerate(names)}
+        size = EPOCH_SIZE + SLOT.size * len(self._offsets)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # The first worker to start sizes the file and picks the epoch
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            if os.pread(self._fd, EPOCH_SIZE, 0) == bytes(EPOCH_SIZE):
+                os.pwrite(self._fd, os.urandom(EPOCH_SIZE), 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+
+    @property
+    def epoch(self) -> str:
+        return self._map[:EPOCH_SIZE].hex()
+
+    def get(self, name: str) -> int:
+        return SLOT.unpack_from(self._map, self._offsets[name])[0]
+
+    def increment(self, name: str) -> int:
+        offset = self._offsets[name]
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            version = SLOT.unpack_from(self._map, offset)[0] + 1
+            SLOT.pack_into(self._map, offset, version)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return version
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class SharedVoteLog:
+    def __init__(self, path: str, capacity: int = 4096):
+        self.path = path
+        self.capacity = capacity
+        size = LOG_HEAD.size + capacity * LOG_RECORD.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # A ring of another capacity cannot be reused; start it over empty
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+        self._read = LOG_HEAD.unpack_from(self._map, 0)[0]
+
+    def _offset(self, seq: int) -> int:
+        return LOG_HEAD.size + (seq % self.capacity) * LOG_RECORD.size
+
+    def append(self, formation_id: str, theme: Optional[str], votes: int):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            seq = LOG_HEAD.unpack_from(self._map, 0)[0] + 1
+            LOG_RECORD.pack_into(self._map, self._offset(seq), seq, votes, theme_hash(theme), formation_id.encode())
+            LOG_HEAD.pack_into(self._map, 0, seq)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def read_new(self) -> Optional[List[Tuple[str, int, bytes]]]:
+        """(formation id, votes, theme hash) appended since the last call; None if the ring overran them."""
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+        try:
+            head = LOG_HEAD.unpack_from(self._map, 0)[0]
+            start, self._read = self._read, head
+            if head < start or head - start > self.capacity:
+                return None
+            records = []
+            for seq in range(start + 1, head + 1):
+                stored, votes, theme, formation_id = LOG_RECORD.unpack_from(self._map, self._offset(seq))
+                if stored != seq:
+                    return None
+                records.append((formation_id.rstrip(b"\0").decode(), votes, theme))
+            return records
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class CoherenceMiddleware:
+    def __init__(self, app, versions, on_change: Callable[[str], None]):
+        self.app = app
+        self.versions = versions
+        self.on_change = on_change
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            for name in self.versions.sync():
+                self.on_change(name)
+        await self.app(scope, receive, send)
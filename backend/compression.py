@@ -0,0 +1,97 @@
+"""Response compression off the event loop.
+
+Complete (non-streaming) bodies of at least `min_size` bytes are compressed
+with brotli when the client accepts it and the `brotli` package is
+installed, with gzip otherwise. Compression runs in a worker thread. Small
+bodies, streamed responses (NDJSON) and already-encoded responses are passed
+through unchanged.
+"""
+import asyncio
+import gzip
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {}
+    for entry in accept_encoding.split(","):
+        coding, _, params = entry.partition(";")
+        q = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                q = float(value)
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size: int = 1024):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                return
+
+            # First body message: only complete bodies are worth compressing
+            body = message.get("body", b"")
+            response_headers = start.get("headers", [])
+            encoded = any(name.lower() == b"content-encoding" for name, _ in response_headers)
+            if message.get("more_body") or encoded or len(body) < self.min_size:
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            compressed = await asyncio.to_thread(compress, body, encoding)
+            response_headers = [(name, value) for name, value in response_headers if name.lower() != b"content-length"]
+            response_headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+            ]
+            if not any(name.lower() == b"vary" and b"accept-encoding" in value.lower()
+                       for name, value in response_headers):
+                response_headers.append((b"vary", b"Accept-Encoding"))
+            passthrough = True
+            await send({**start, "headers": response_headers})
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,261 @@
+"""Theme filter_criteria language and materialized eligible-player sets.
+
+A criteria dict is compiled once into a Mongo query and an equivalent Python
+predicate:
+
+    {"club": "Barcelona"}                          exact match
+    {"country": ["Brazil", "Argentina"]}           any of ($in)
+    {"position": {"$nin": ["GK"]}}                 $in / $nin / $eq / $ne
+    {"rating": {"$gte": 85}}, {"min_rating": 85}   rating ranges
+    {"achievements": "World Cup"}                  case-insensitive substring
+    {"achievements": {"$any": ["Euro", "Copa"]}}   $contains / $any / $all / $regex
+
+`EligibilityIndex` keeps, per theme name, the sorted ids of the players that
+satisfy the theme. The ids are materialized when the theme is registered. A
+new player is matched in memory, and bulk loads mark every set stale so it is
+recomputed on next use.
+"""
+import asyncio
+import logging
+import re
+from bisect import insort
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STRING_FIELDS = ("position", "club", "country", "era")
+STRING_OPERATORS = ("$eq", "$ne", "$in", "$nin")
+RANGE_OPERATORS = {
+    "$eq": lambda a, b: a == b,
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+Predicate = Callable[[dict], bool]
+
+
+class CriteriaError(ValueError):
+    pass
+
+
+def _string_list(field, value) -> List[str]:
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise CriteriaError(f"{field}: expected a list of strings")
+    return value
+
+
+def _compile_string(field: str, spec) -> Tuple[dict, Predicate]:
+    if isinstance(spec, str):
+        spec = {"$eq": spec}
+    elif isinstance(spec, list):
+        spec = {"$in": spec}
+    if not isinstance(spec, dict) or not spec:
+        raise CriteriaError(f"{field}: expected a string, a list or an operator object")
+
+    query, checks = {}, []
+    for op, value in spec.items():
+        if op not in STRING_OPERATORS:
+            raise CriteriaError(f"{field}: unsupported operator {op}")
+        if op in ("$in", "$nin"):
+            values = frozenset(_string_list(field, value))
+            query[op] = sorted(values)
+            checks.append((lambda vs: lambda v: v in vs)(values) if op == "$in"
+                          else (lambda vs: lambda v: v not in vs)(values))
+        else:
+            if not isinstance(value, str):
+                raise CriteriaError(f"{field}: {op} expects a string")
+            query[op] = value
+            checks.append((lambda x: lambda v: v == x)(value) if op == "$eq"
+                          else (lambda x: lambda v: v != x)(value))
+    if list(query) == ["$eq"]:
+        query = query["$eq"]
+    return {field: query}, lambda player: all(check(player.get(field)) for check in checks)
+
+
+def _compile_rating(spec) -> Tuple[dict, Predicate]:
+    if isinstance(spec, int) and not isinstance(spec, bool):
+        spec = {"$eq": spec}
+    if not isinstance(spec, dict) or not spec:
+        raise CriteriaError("rating: expected a number or a range object")
+    checks = []
+    for op, value in spec.items():
+        if op not in RANGE_OPERATORS:
+            raise CriteriaError(f"rating: unsupported operator {op}")
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise CriteriaError(f"rating: {op} expects a number")
+        checks.append((RANGE_OPERATORS[op], value))
+    return {"rating": dict(spec)}, lambda player: all(
+        player.get("rating") is not None and test(player["rating"], value) for test, value in checks
+    )
+
+
+def _achievement_pattern(field_op: str, pattern: str, literal: bool = True):
+    if not isinstance(pattern, str) or not pattern:
+        raise CriteriaError(f"achievements: {field_op} expects a non-empty string")
+    try:
+        return re.compile(re.escape(pattern) if literal else pattern, re.IGNORECASE)
+    except re.error as e:
+        raise CriteriaError(f"achievements: invalid pattern: {e}")
+
+
+def _compile_achievements(spec) -> Tuple[dict, Predicate]:
+    if isinstance(spec, str):
+        spec = {"$contains": spec}
+    elif isinstance(spec, list):
+        spec = {"$all": spec}
+    if not isinstance(spec, dict) or len(spec) != 1:
+        raise CriteriaError("achievements: expected a string, a list or a single operator object")
+
+    (op, value), = spec.items()
+    if op in ("$contains", "$regex"):
+        patterns = [_achievement_pattern(op, value, literal=op == "$contains")]
+        mode = all
+    elif op in ("$any", "$all"):
+        patterns = [_achievement_pattern(op, v) for v in _string_list("achievements", value)]
+        mode = any if op == "$any" else all
+    else:
+        raise CriteriaError(f"achievements: unsupported operator {op}")
+    if not patterns:
+        # Mongo rejects an empty $or/$and
+        raise CriteriaError(f"achievements: {op} needs at least one value")
+
+    def regex(p):
+        return {"$regex": p.pattern, "$options": "i"}
+
+    if mode is any:
+        query = {"$or": [{"achievements": regex(p)} for p in patterns]}
+    elif len(patterns) == 1:
+        query = {"achievements": regex(patterns[0])}
+    else:
+        query = {"$and": [{"achievements": regex(p)} for p in patterns]}
+
+    def predicate(player):
+        achievements = player.get("achievements") or []
+        return mode(any(p.search(a) for a in achievements) for p in patterns)
+    return query, predicate
+
+
+def compile_criteria(criteria: Optional[dict]) -> Tuple[dict, Predicate]:
+    """Compile `criteria` into (mongo query, python predicate); raises CriteriaError."""
+    if criteria is None:
+        criteria = {}
+    if not isinstance(criteria, dict):
+        raise CriteriaError("filter_criteria must be an object")
+
+    rating = {}
+    clauses, predicates = [], []
+    for field, spec in criteria.items():
+        if field == "min_rating":
+            rating["$gte"] = spec
+        elif field == "max_rating":
+            rating["$lte"] = spec
+        elif field == "rating":
+            rating.update(spec if isinstance(spec, dict) else {"$eq": spec})
+        elif field in STRING_FIELDS:
+            query, predicate = _compile_string(field, spec)
+            clauses.append(query)
+            predicates.append(predicate)
+        elif field == "achievements":
+            query, predicate = _compile_achievements(spec)
+            clauses.append(query)
+            predicates.append(predicate)
+        else:
+            raise CriteriaError(f"Unknown criteria field: {field}")
+    if rating:
+        query, predicate = _compile_rating(rating)
+        clauses.append(query)
+        predicates.append(predicate)
+
+    # Flat query where keys don't collide ($or from achievements, etc.), $and otherwise
+    query = {}
+    for clause in clauses:
+        if any(key in query for key in clause):
+            query.setdefault("$and", []).append(clause)
+        else:
+            query.update(clause)
+    return query, lambda player: all(predicate(player) for predicate in predicates)
+
+
+class _Eligibility:
+    def __init__(self, query: dict, predicate: Predicate):
+        self.query = query
+        self.predicate = predicate
+        self.ids: Optional[List[str]] = None
+        self.lock = asyncio.Lock()
+
+
+class EligibilityIndex:
+    def __init__(self, collection):
+        self.collection = collection
+        self._themes: Dict[str, _Eligibility] = {}
+
+    def register(self, name: str, criteria: Optional[dict]):
+        query, predicate = compile_criteria(criteria)
+        self._themes[name] = _Eligibility(query, predicate)
+
+    def query(self, name: str) -> Optional[dict]:
+        entry = self._themes.get(name)
+        return entry.query if entry else None
+
+    async def resolve(self, name: str, themes_collection) -> Optional[dict]:
+        """Like `query`, but a theme created by another worker is registered from Mongo first."""
+        if name not in self._themes:
+            theme = await themes_collection.find_one({"name": name}, {"filter_criteria": 1}, sort=[("date", -1)])
+            if theme is None:
+                return None
+            try:
+                self.register(name, theme.get("filter_criteria"))
+            except CriteriaError as e:
+                logger.warning("Skipping theme %r with invalid criteria: %s", name, e)
+                return None
+        return self.query(name)
+
+    async def prepare(self, criteria: Optional[dict]) -> _Eligibility:
+        """Compile and materialize `criteria` without registering it; pass the result to `adopt`.
+
+        Raises CriteriaError for an invalid spec, or OperationFailure when Mongo rejects the query.
+        """
+        query, predicate = compile_criteria(criteria)
+        entry = _Eligibility(query, predicate)
+        cursor = self.collection.find(query, {"_id": 0, "id": 1}).sort("id", 1)
+        entry.ids = [doc["id"] async for doc in cursor]
+        return entry
+
+    def adopt(self, name: str, entry: _Eligibility):
+        """Register an entry from `prepare`, once the theme it belongs to is stored."""
+        self._themes[name] = entry
+
+    async def ids(self, name: str) -> Optional[List[str]]:
+        """Sorted ids of the players eligible for theme `name`, or None for an unknown theme."""
+        entry = self._themes.get(name)
+        if entry is None:
+            return None
+        if entry.ids is None:
+            async with entry.lock:
+                if entry.ids is None:
+                    cursor = self.collection.find(entry.query, {"_id": 0, "id": 1}).sort("id", 1)
+                    entry.ids = [doc["id"] async for doc in cursor]
+        return entry.ids
+
+    def add_player(self, player: dict):
+        for entry in self._themes.values():
+            if entry.ids is not None and entry.predicate(player):
+                insort(entry.ids, player["id"])
+
+    def invalidate(self):
+        for entry in self._themes.values():
+            entry.ids = None
+
+    def clear(self):
+        """Forget every registration; `resolve` reloads themes from Mongo as they are used."""
+        self._themes = {}
+
+    async def load(self, themes_collection):
+        """Register every stored theme, oldest first so the newest of a name wins."""
+        async for theme in themes_collection.find({}, {"name": 1, "filter_criteria": 1}).sort("date", 1):
+            try:
+                self.register(theme["name"], theme.get("filter_criteria"))
+            except CriteriaError as e:
+                logger.warning("Skipping theme %r with invalid criteria: %s", theme["name"], e)
@@ -0,0 +1,70 @@
+"""Per-worker cache of the daily theme.
+
+The theme is resolved once per UTC day and kept until the next midnight.
+Concurrent callers share one resolution, and the fallback theme is created
+with an upsert on a per-day key that has a unique index. That way, several
+workers racing at midnight still produce a single document.
+"""
+import asyncio
+from datetime import datetime, time, timedelta
+from typing import Callable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+class DailyThemeResolver:
+    def __init__(self, collection, build_default: Callable[[], dict], on_create: Optional[Callable[[], None]] = None):
+        self.collection = collection
+        self.build_default = build_default
+        self.on_create = on_create
+        self._theme: Optional[dict] = None
+        self._expires_at: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+
+    def _cached(self, now: datetime) -> Optional[dict]:
+        if self._theme is not None and now < self._expires_at:
+            return self._theme
+        return None
+
+    async def get(self) -> dict:
+        theme = self._cached(datetime.utcnow())
+        if theme is not None:
+            return theme
+        async with self._lock:
+            now = datetime.utcnow()
+            theme = self._cached(now)
+            if theme is None:
+                start = datetime.combine(now.date(), time.min)
+                end = start + timedelta(days=1)
+                theme = await self._resolve(start, end)
+                self._theme, self._expires_at = theme, end
+            return theme
+
+    async def _resolve(self, start: datetime, end: datetime) -> dict:
+        theme = await self.collection.find_one(
+            {"is_daily": True, "date": {"$gte": start, "$lt": end}}, {"_id": 0}
+        )
+        if theme:
+            return theme
+
+        daily_key = start.date().isoformat()
+        try:
+            theme = await self.collection.find_one_and_update(
+                {"daily_key": daily_key},
+                {"$setOnInsert": {**self.build_default(), "daily_key": daily_key}},
+                projection={"_id": 0},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Another worker won the upsert race
+            return await self.collection.find_one({"daily_key": daily_key}, {"_id": 0})
+        if self.on_create:
+            # Possibly a no-op upsert when another worker created it first; at most once a day
+            self.on_create()
+        return theme
+
+    def invalidate(self):
+        self._theme = None
+        self._expires_at = None
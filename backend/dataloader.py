@@ -0,0 +1,44 @@
+"""Dataloader-style batching of lookups by key.
+
+Every `load` issued in the same event-loop tick is collected and resolved by
+a single call to `batch_load`, which receives the distinct keys and returns a
+dict of the values it found. Missing keys resolve to None. A loader memoizes
+its results, so create one per request.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List
+
+
+class DataLoader:
+    def __init__(self, batch_load: Callable[[List[Hashable]], Awaitable[Dict]], max_batch_size: int = 1000):
+        self.batch_load = batch_load
+        self.max_batch_size = max_batch_size
+        self._futures: Dict[Hashable, asyncio.Future] = {}
+        self._queue: List[Hashable] = []
+
+    def load(self, key: Hashable) -> Awaitable:
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            self._queue.append(key)
+            if len(self._queue) == 1:
+                loop.call_soon(lambda: loop.create_task(self._dispatch()))
+        return future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> list:
+        return await asyncio.gather(*(self.load(key) for key in keys))
+
+    async def _dispatch(self):
+        queue, self._queue = self._queue, []
+        for start in range(0, len(queue), self.max_batch_size):
+            batch = queue[start:start + self.max_batch_size]
+            try:
+                results = await self.batch_load(batch)
+            except Exception as e:
+                for key in batch:
+                    # Forget failures so a later load can retry
+                    self._futures.pop(key).set_exception(e)
+            else:
+                for key in batch:
+                    self._futures[key].set_result(results.get(key))
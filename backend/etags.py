@@ -0,0 +1,139 @@
+"""Conditional GET for the catalog, themes and rankings.
+
+Every write path bumps the in-process version counter of the collections it
+touches. `ConditionalGetMiddleware` derives a strong ETag from the versions a
+route depends on, the path and query string, and the Accept and
+Accept-Encoding headers. The tag
+is computed before the request reaches the route, so a matching
+`If-None-Match` is answered with 304 without touching Mongo or serializing
+anything. Responses carry `Cache-Control: no-cache`, so browsers and the
+nginx proxy may store them but must revalidate before reuse.
+
+Counters start from a random per-process epoch. Tags from another worker or
+from before a restart never match, so the worst case is a full response, not
+a stale one. With `shared` counters (see coherence.py), all workers on the
+host share the epoch and the counters, so they issue the same tags. Each
+worker tags with the versions it has adopted through `sync`, which means
+after its own caches were invalidated, so a tag never labels older content.
+"""
+import hashlib
+import re
+import uuid
+from typing import Dict, Iterable, List, Optional, Pattern, Sequence, Tuple
+
+from starlette.routing import Match
+
+CACHE_CONTROL = "no-cache"
+
+
+class CollectionVersions:
+    def __init__(self, names: Iterable[str], shared=None):
+        self.shared = shared
+        self.epoch = shared.epoch if shared else uuid.uuid4().hex
+        self._versions: Dict[str, int] = {name: shared.get(name) if shared else 0 for name in names}
+
+    def bump(self, *names: str):
+        for name in names:
+            if self.shared is None:
+                self._versions[name] += 1
+                continue
+            version = self.shared.increment(name)
+            # Skipped numbers are writes by other workers; leave them for sync() to report
+            if version == self._versions[name] + 1:
+                self._versions[name] = version
+
+    def sync(self) -> List[str]:
+        """Adopt versions bumped by other workers; returns the collections that changed."""
+        if self.shared is None:
+            return []
+        changed = []
+        for name, version in self._versions.items():
+            current = self.shared.get(name)
+            if current != version:
+                self._versions[name] = current
+                changed.append(name)
+        return changed
+
+    def get(self, name: str) -> int:
+        return self._versions[name]
+
+    def etag(self, collections: Sequence[str], variant: bytes) -> str:
+        digest = hashlib.blake2b(digest_size=12)
+        digest.update(self.epoch.encode())
+        for name in collections:
+            digest.update(f"|{name}:{self._versions[name]}".encode())
+        digest.update(b"|" + variant)
+        return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as RFC 9110 prescribes for If-None-Match."""
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class ConditionalGetMiddleware:
+    def __init__(self, app, versions: CollectionVersions, rules: List[Tuple[str, Sequence[str]]], router=None):
+        self.app = app
+        self.versions = versions
+        # Used to label short-circuited 304s with their route, as routing would have
+        self.router = router
+        # (path pattern, collections the response depends on); the first match wins
+        self.rules: List[Tuple[Pattern, Sequence[str]]] = [(re.compile(p), c) for p, c in rules]
+
+    def _collections(self, path: str) -> Optional[Sequence[str]]:
+        for pattern, collections in self.rules:
+            if pattern.fullmatch(path):
+                return collections
+        return None
+
+    def _resolve_route(self, scope):
+        for route in getattr(self.router, "routes", ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                scope["route"] = route
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+        collections = self._collections(scope["path"])
+        if collections is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        # Representations differ by format and content-coding, so strong tags must too
+        variant = b"%s?%s|%s|%s" % (
+            scope["path"].encode(), scope["query_string"],
+            headers.get(b"accept", b""), headers.get(b"accept-encoding", b""),
+        )
+        etag = self.versions.etag(collections, variant)
+        validators = [
+            (b"etag", etag.encode()),
+            (b"cache-control", CACHE_CONTROL.encode()),
+            (b"vary", b"Accept, Accept-Encoding"),
+        ]
+
+        if_none_match = headers.get(b"if-none-match")
+        if if_none_match and etag_matches(if_none_match.decode("latin-1"), etag):
+            # The request never reaches the router; per-route metrics still need the template
+            self._resolve_route(scope)
+            await send({"type": "http.response.start", "status": 304, "headers": validators})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                message["headers"] = list(message.get("headers", [])) + validators
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,96 @@
+"""Team-quality aggregates stored on each formation when it is written.
+
+`formation_aggregates` summarises a line-up from its players: total and average
+rating, the average rating of each line (goalkeeper, defence, midfield,
+attack), and the distinct countries and eras. The result is saved on the
+formation document. Rankings by quality are then a single indexed sort and do
+not need a join against `players`.
+
+The aggregates are a snapshot taken when the formation is created, like the
+line-up itself. `backfill_aggregates` fills them in for formations stored
+before they existed.
+"""
+import logging
+import re
+from typing import Dict, Iterable, Mapping, Optional
+
+from pymongo import UpdateOne
+
+from optimizer import FORMATION_SLOTS
+
+logger = logging.getLogger(__name__)
+
+LINES = ("goalkeeper", "defence", "midfield", "attack")
+LINE_OF_ROLE: Dict[str, str] = {
+    "GK": "goalkeeper",
+    "CB": "defence", "LB": "defence", "RB": "defence",
+    "CM": "midfield", "LM": "midfield", "RM": "midfield",
+    "LW": "attack", "RW": "attack", "ST": "attack",
+}
+AGGREGATE_FIELDS = ("total_rating", "avg_rating", "line_ratings", "countries", "eras")
+
+
+def slot_role(formation_name: str, slot: str) -> str:
+    """The role of `slot`: from the formation's layout, else the slot name without its number."""
+    role = FORMATION_SLOTS.get(formation_name, {}).get(slot)
+    return role or re.sub(r"\d+$", "", slot)
+
+
+def formation_aggregates(formation_name: str, slots: Iterable[Mapping], players: Mapping[str, Mapping]) -> dict:
+    """Aggregates of the slots (`player_id`, `position_slot`) whose player is in `players`."""
+    ratings = []
+    line_ratings: Dict[str, list] = {}
+    countries = set()
+    eras = set()
+    for slot in slots:
+        player = players.get(slot["player_id"])
+        if player is None:
+            continue
+        ratings.append(player["rating"])
+        countries.add(player["country"])
+        eras.add(player["era"])
+        line = LINE_OF_ROLE.get(slot_role(formation_name, slot["position_slot"]))
+        if line:
+            line_ratings.setdefault(line, []).append(player["rating"])
+    return {
+        "total_rating": sum(ratings),
+        "avg_rating": round(sum(ratings) / len(ratings), 2) if ratings else 0.0,
+        "line_ratings": {
+            line: round(sum(line_ratings[line]) / len(line_ratings[line]), 2) for line in LINES if line in line_ratings
+        },
+        "countries": sorted(countries),
+        "eras": sorted(eras),
+    }
+
+
+async def backfill_aggregates(formations, players, batch_size: int = 500, limit: Optional[int] = None) -> int:
+    """Compute the aggregates of formations that have none; returns how many were updated."""
+    updated = 0
+    cursor = formations.find({"total_rating": {"$exists": False}}, {"_id": 0, "id": 1, "formation_name": 1, "players": 1})
+    if limit:
+        cursor = cursor.limit(limit)
+    batch = []
+
+    async def flush():
+        player_ids = list({slot["player_id"] for doc in batch for slot in doc["players"]})
+        found = {
+            doc["id"]: doc
+            async for doc in players.find({"id": {"$in": player_ids}}, {"_id": 0, "id": 1, "rating": 1, "country": 1, "era": 1})
+        }
+        await formations.bulk_write([
+            UpdateOne({"id": doc["id"]}, {"$set": formation_aggregates(doc["formation_name"], doc["players"], found)})
+            for doc in batch
+        ], ordered=False)
+
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await flush()
+            updated += len(batch)
+            batch = []
+    if batch:
+        await flush()
+        updated += len(batch)
+    if updated:
+        logger.info("Backfilled aggregates of %d formations", updated)
+    return updated
@@ -0,0 +1,258 @@
+"""Declarative MongoDB index registry.
+
+Every collection used by server.py lists the indexes its routes rely on here.
+`reconcile_indexes` runs on startup and brings the database in line with the
+registry; `assert_no_collscan` explains each route's query and fails when one
+of them would fall back to a full collection scan.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+def _id_index() -> IndexModel:
+    return IndexModel([("id", ASCENDING)], name="id_unique", unique=True)
+
+
+FORMATION_READ_INDEXES = [
+    IndexModel([("theme", ASCENDING), ("votes", DESCENDING)], name="theme_votes"),
+    IndexModel([("votes", DESCENDING)], name="votes"),
+    # Quality rankings over the aggregates stored at write time
+    IndexModel([("theme", ASCENDING), ("total_rating", DESCENDING)], name="theme_total_rating"),
+    IndexModel([("theme", ASCENDING), ("avg_rating", DESCENDING)], name="theme_avg_rating"),
+    IndexModel([("total_rating", DESCENDING)], name="total_rating"),
+    IndexModel([("avg_rating", DESCENDING)], name="avg_rating"),
+    # ?country= and ?era= with every supported sort
+    IndexModel([("countries", ASCENDING), ("votes", DESCENDING)], name="countries_votes"),
+    IndexModel([("countries", ASCENDING), ("total_rating", DESCENDING)], name="countries_total_rating"),
+    IndexModel([("countries", ASCENDING), ("avg_rating", DESCENDING)], name="countries_avg_rating"),
+    IndexModel([("eras", ASCENDING), ("votes", DESCENDING)], name="eras_votes"),
+    IndexModel([("eras", ASCENDING), ("total_rating", DESCENDING)], name="eras_total_rating"),
+    IndexModel([("eras", ASCENDING), ("avg_rating", DESCENDING)], name="eras_avg_rating"),
+]
+
+INDEXES = {
+    "players": [
+        _id_index(),
+        # Filters are followed by `id` so keyset pages stay a single range scan
+        IndexModel([("position", ASCENDING), ("id", ASCENDING)], name="position_id"),
+        IndexModel([("club", ASCENDING), ("id", ASCENDING)], name="club_id"),
+        IndexModel([("era", ASCENDING), ("id", ASCENDING)], name="era_id"),
+        IndexModel([("country", ASCENDING), ("id", ASCENDING)], name="country_id"),
+        IndexModel([("rating", DESCENDING), ("id", ASCENDING)], name="rating_id"),
+        # Per-position candidate buckets of the XI optimizer
+        IndexModel([("position", ASCENDING), ("rating", DESCENDING)], name="position_rating"),
+        # Default natural key for bulk upserts
+        IndexModel([("name", ASCENDING), ("country", ASCENDING)], name="name_country"),
+    ],
+    "formations": [
+        _id_index(),
+        *FORMATION_READ_INDEXES,
+        # The retention job looks for old, rarely voted formations
+        IndexModel([("created_at", ASCENDING), ("votes", ASCENDING)], name="created_at_votes"),
+    ],
+    # Read with ?include_archived=true through the same query shapes as formations
+    "formations_archive": [
+        _id_index(),
+        *FORMATION_READ_INDEXES,
+    ],
+    # Time-bucketed vote counters behind the trending rankings (trending.py)
+    "vote_buckets": [
+        IndexModel([("formation_id", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)],
+                   name="formation_bucket_unique", unique=True),
+        # Window sums and compaction scan a range of bucket starts
+        IndexModel([("bucket", ASCENDING)], name="bucket"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "themes": [
+        _id_index(),
+        IndexModel([("is_daily", ASCENDING), ("date", ASCENDING)], name="is_daily_date"),
+        IndexModel([("date", DESCENDING)], name="date"),
+        # Themes created by another worker are looked up by name
+        IndexModel([("name", ASCENDING), ("date", DESCENDING)], name="name_date"),
+        # One default daily theme per UTC day, whatever the number of workers
+        IndexModel([("daily_key", ASCENDING)], name="daily_key_unique", unique=True,
+                   partialFilterExpression={"daily_key": {"$exists": True}}),
+        # Unused default daily themes are deleted once expires_at passes
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+
+def _route_queries():
+    """The query shape of every read route, as (route, collection, filter, sort)."""
+    today = datetime.combine(datetime.utcnow().date(), time.min)
+    return [
+        ("get_players", "players", {}, [("id", ASCENDING)]),
+        ("get_players?position", "players", {"position": "ST"}, [("id", ASCENDING)]),
+        ("get_players?club", "players", {"club": "Barcelona"}, [("id", ASCENDING)]),
+        ("get_players?era", "players", {"era": "1990s"}, [("id", ASCENDING)]),
+        ("get_players?country", "players", {"country": {"$in": ["Brazil", "Argentina"]}}, [("id", ASCENDING)]),
+        ("get_players?min_rating", "players", {"rating": {"$gte": 90}}, [("id", ASCENDING)]),
+        ("get_player", "players", {"id": "explain"}, None),
+        ("optimize_formation", "players", {"position": "CM"}, [("rating", DESCENDING)]),
+        ("get_formations", "formations", {}, [("votes", DESCENDING)]),
+        ("get_formations?theme", "formations", {"theme": "explain"}, [("votes", DESCENDING)]),
+        ("get_formations?sort=total_rating", "formations", {}, [("total_rating", DESCENDING)]),
+        ("get_formations?theme&sort=avg_rating", "formations", {"theme": "explain"}, [("avg_rating", DESCENDING)]),
+        *(
+            (f"get_formations?{param}&sort={sort}", "formations", {field: value}, [(sort, DESCENDING)])
+            for param, field, value in (("country", "countries", "Brazil"), ("era", "eras", "1990s"))
+            for sort in ("votes", "total_rating", "avg_rating")
+        ),
+        ("get_formations?min_avg_rating", "formations", {"avg_rating": {"$gte": 80}}, [("votes", DESCENDING)]),
+        ("get_formations?include_archived", "formations_archive", {"theme": "explain"}, [("votes", DESCENDING)]),
+        ("vote_formation", "formations", {"id": "explain"}, None),
+        ("archive_formations", "formations", {
+            "created_at": {"$lt": today - timedelta(days=90)},
+            "votes": {"$lt": 5},
+        }, None),
+        ("get_themes", "themes", {}, [("date", DESCENDING)]),
+        ("resolve_theme", "themes", {"name": "explain"}, [("date", DESCENDING)]),
+        ("get_daily_theme", "themes", {
+            "is_daily": True,
+            "date": {
+                "$gte": today,
+                "$lt": today + timedelta(days=1),
+            },
+        }, None),
+        ("get_daily_theme?default", "themes", {"daily_key": today.date().isoformat()}, None),
+    ]
+
+
+# Index options the registry may set; any difference in them means the index changed
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression", "collation")
+
+
+def _key_spec(key):
+    return [(field, direction) for field, direction in key.items()]
+
+
+def _options(spec) -> dict:
+    """The options of an index definition or of `index_information()`, with defaults left out."""
+    options = {}
+    for option in INDEX_OPTIONS:
+        value = spec.get(option)
+        if value is None or value is False:
+            continue
+        if option == "expireAfterSeconds":
+            value = int(value)
+        elif isinstance(value, dict):
+            value = dict(value)
+        options[option] = value
+    return options
+
+
+def _ttl_only_change(current: dict, wanted: dict) -> bool:
+    """True when the indexes differ in expireAfterSeconds alone, which collMod changes in place."""
+    if "expireAfterSeconds" not in current or "expireAfterSeconds" not in wanted:
+        return False
+    strip = lambda options: {k: v for k, v in options.items() if k != "expireAfterSeconds"}
+    return strip(current) == strip(wanted)
+
+
+async def reconcile_indexes(db, registry=None, drop_unknown: bool = False):
+    """Create missing indexes and rebuild the ones whose keys or options changed.
+
+    A change to `expireAfterSeconds` alone is applied in place with collMod.
+    """
+    registry = registry or INDEXES
+    for collection_name, models in registry.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        to_create = []
+        for model in models:
+            spec = model.document
+            name = spec["name"]
+            current = existing.get(name)
+            if current is not None:
+                same_key = current["key"] == _key_spec(spec["key"])
+                current_options, wanted_options = _options(current), _options(spec)
+                if same_key and current_options == wanted_options:
+                    continue
+                if same_key and _ttl_only_change(current_options, wanted_options):
+                    logger.info("Changing TTL of index %s.%s to %ss", collection_name, name,
+                                wanted_options["expireAfterSeconds"])
+                    await db.command("collMod", collection_name, index={
+                        "name": name, "expireAfterSeconds": wanted_options["expireAfterSeconds"],
+                    })
+                    continue
+                logger.info("Rebuilding index %s.%s", collection_name, name)
+                await collection.drop_index(name)
+            to_create.append(model)
+
+        if to_create:
+            try:
+                await collection.create_indexes(to_create)
+            except OperationFailure as e:
+                # Usually duplicate ids in legacy data; keep serving without the index
+                logger.error("Could not create indexes on %s: %s", collection_name, e)
+            else:
+                logger.info("Created indexes on %s: %s", collection_name,
+                            ", ".join(m.document["name"] for m in to_create))
+
+        if drop_unknown:
+            wanted = {m.document["name"] for m in models} | {"_id_"}
+            for name in existing:
+                if name not in wanted:
+                    logger.info("Dropping unregistered index %s.%s", collection_name, name)
+                    await collection.drop_index(name)
+
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+async def find_collscans(db):
+    """Return the routes whose winning query plan contains a COLLSCAN."""
+    offenders = []
+    for route, collection_name, filter_dict, sort in _route_queries():
+        cursor = db[collection_name].find(filter_dict)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in set(_plan_stages(winning_plan)):
+            offenders.append(route)
+    return offenders
+
+
+async def assert_no_collscan(db):
+    offenders = await find_collscans(db)
+    if offenders:
+        raise AssertionError(f"Queries fall back to COLLSCAN: {', '.join(offenders)}")
+
+
+async def _check():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        db = client[os.environ['DB_NAME']]
+        await reconcile_indexes(db)
+        await assert_no_collscan(db)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    # `python indexes.py` reconciles the registry and fails on any COLLSCAN
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_check())
+    print("All route queries are index-backed")
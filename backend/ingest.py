@@ -0,0 +1,138 @@
+"""Streaming bulk ingestion of player records.
+
+The request body is read chunk by chunk and parsed as NDJSON or CSV, records
+are validated in chunks and written with unordered `insert_many` (or upserts
+keyed on a natural key). Bad rows are reported back by line number and never
+abort the rest of the load.
+"""
+import codecs
+import csv
+import json
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+MAX_REPORTED_ERRORS = 1000
+CSV_LIST_SEPARATOR = "|"
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (line number, record dict or parse error) pairs."""
+    header = None
+    line_number = 0
+    async for line in iter_lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        if fmt == "csv":
+            # One record per line; quoted fields cannot span lines
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            if len(values) != len(header):
+                yield line_number, ValueError(f"expected {len(header)} columns, got {len(values)}")
+                continue
+            record = dict(zip(header, values))
+            if "achievements" in record:
+                record["achievements"] = [a.strip() for a in record["achievements"].split(CSV_LIST_SEPARATOR) if a.strip()]
+            yield line_number, record
+        else:
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                yield line_number, e
+
+
+class BulkResult:
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors: List[dict] = []
+
+    def add_error(self, row: int, error):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": str(error)})
+
+    def dict(self) -> dict:
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+async def _write_chunk(collection, rows: List[Tuple[int, dict]], upsert_key: Optional[List[str]], result: BulkResult):
+    documents = [doc for _, doc in rows]
+    try:
+        if upsert_key:
+            operations = []
+            for doc in documents:
+                fields = {k: v for k, v in doc.items() if k != "id"}
+                operations.append(UpdateOne(
+                    {k: doc[k] for k in upsert_key},
+                    {"$set": fields, "$setOnInsert": {"id": doc["id"]}},
+                    upsert=True,
+                ))
+            write = await collection.bulk_write(operations, ordered=False)
+            result.inserted += write.upserted_count
+            result.updated += write.matched_count
+        else:
+            write = await collection.insert_many(documents, ordered=False)
+            result.inserted += len(write.inserted_ids)
+    except BulkWriteError as e:
+        details = e.details
+        result.inserted += details.get("nInserted", 0) + details.get("nUpserted", 0)
+        result.updated += details.get("nMatched", 0)
+        for error in details.get("writeErrors", []):
+            result.add_error(rows[error["index"]][0], error.get("errmsg", "write error"))
+
+
+async def ingest_players(
+    collection,
+    records: AsyncIterator[Tuple[int, object]],
+    validate: Callable[[dict], dict],
+    chunk_size: int = 1000,
+    upsert_key: Optional[List[str]] = None,
+) -> BulkResult:
+    """Validate and write `records`; `validate` returns the document to store or raises ValueError."""
+    result = BulkResult()
+    chunk: List[Tuple[int, dict]] = []
+    async for row, record in records:
+        result.received += 1
+        if isinstance(record, Exception):
+            result.add_error(row, record)
+            continue
+        if not isinstance(record, dict):
+            result.add_error(row, "record must be an object")
+            continue
+        try:
+            chunk.append((row, validate(record)))
+        except ValueError as e:
+            result.add_error(row, e)
+            continue
+        if len(chunk) >= chunk_size:
+            await _write_chunk(collection, chunk, upsert_key, result)
+            chunk = []
+    if chunk:
+        await _write_chunk(collection, chunk, upsert_key, result)
+    return result
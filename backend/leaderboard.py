@@ -0,0 +1,126 @@
+"""Incrementally maintained top-N formation rankings.
+
+One board per theme plus an overall board (keyed by `None`). Each board keeps
+its entries in a list sorted by (-votes, id) so that reads are a plain copy of
+at most `size` formations. Votes only ever grow, which keeps the boards exact:
+anything outside a full board has at most as many votes as its last entry, so
+a formation only has to be offered again when its vote count changes.
+
+`apply_votes` takes a vote count reported by another worker, which knows the
+formation only by id. A board holding the formation re-ranks it. A board that
+does not hold it but would now rank it is dropped and reseeded on its next
+read.
+"""
+from bisect import bisect_left, insort
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class _Board:
+    def __init__(self, size: int):
+        self.size = size
+        self._keys = []
+        self._items = {}
+
+    @staticmethod
+    def _key(formation):
+        return (-formation.votes, formation.id)
+
+    def offer(self, formation):
+        current = self._items.get(formation.id)
+        if current is not None:
+            if formation.votes < current.votes:
+                return  # a stale read that finished after a newer one
+            del self._keys[bisect_left(self._keys, self._key(current))]
+        elif len(self._keys) >= self.size:
+            worst = self._keys[-1]
+            if self._key(formation) >= worst:
+                return
+            self._keys.pop()
+            del self._items[worst[1]]
+        insort(self._keys, self._key(formation))
+        self._items[formation.id] = formation
+
+    def get(self, formation_id: str):
+        return self._items.get(formation_id)
+
+    def would_accept(self, formation_id: str, votes: int) -> bool:
+        return len(self._keys) < self.size or (-votes, formation_id) < self._keys[-1]
+
+    def discard(self, formation_id: str):
+        current = self._items.pop(formation_id, None)
+        if current is not None:
+            del self._keys[bisect_left(self._keys, self._key(current))]
+
+    def top(self) -> list:
+        return [self._items[formation_id] for _, formation_id in self._keys]
+
+
+class Leaderboard:
+    def __init__(self, size: int = 100):
+        self.size = size
+        self._boards: Dict[Optional[str], _Board] = {None: _Board(size)}
+
+    def __contains__(self, theme: Optional[str]) -> bool:
+        return theme in self._boards
+
+    def offer(self, formation):
+        """Add a new formation or re-rank one whose vote count changed.
+
+        Votes only grow, so an offer with fewer votes than a board holds is
+        ignored. Boards that were never seeded (or were invalidated) are left
+        alone; the route seeds them from Mongo on their first read.
+        """
+        for theme in (None, formation.theme):
+            board = self._boards.get(theme)
+            if board is not None:
+                board.offer(formation)
+
+    def discard(self, formation):
+        for theme in (None, formation.theme):
+            board = self._boards.get(theme)
+            if board is not None:
+                board.discard(formation.id)
+
+    def find(self, formation_id: str):
+        """The formation with this id from any board, or None if no board holds it."""
+        for board in self._boards.values():
+            formation = board.get(formation_id)
+            if formation is not None:
+                return formation
+        return None
+
+    def apply_votes(self, formation_id: str, votes: int, theme_matches: Callable[[str], bool]):
+        """Re-rank a formation known only by id; `theme_matches` tells which theme boards it belongs to."""
+        known = self.find(formation_id)
+        if known is not None:
+            if votes > known.votes:
+                self.offer(known.model_copy(update={"votes": votes}))
+            return
+        for theme, board in list(self._boards.items()):
+            if (theme is None or theme_matches(theme)) and board.would_accept(formation_id, votes):
+                del self._boards[theme]
+
+    def seed(self, theme: Optional[str], formations: Iterable):
+        board = self._boards[theme] = _Board(self.size)
+        for formation in formations:
+            board.offer(formation)
+
+    def invalidate(self):
+        """Drop every board; each is reseeded from Mongo on its next read."""
+        self._boards = {}
+
+    def top(self, theme: Optional[str] = None) -> Optional[List]:
+        """The ranked formations for `theme`, or None if the theme was never seeded."""
+        board = self._boards.get(theme)
+        return board.top() if board is not None else None
+
+    async def rebuild(self, collection, model):
+        """Reload every board from Mongo; used once on startup."""
+        async def load(filter_dict):
+            cursor = collection.find(filter_dict, {"_id": 0}).sort("votes", -1)
+            return [model(**doc) for doc in await cursor.to_list(self.size)]
+
+        self._boards = {None: _Board(self.size)}
+        self.seed(None, await load({}))
+        for theme in await collection.distinct("theme"):
+            self.seed(theme, await load({"theme": theme}))
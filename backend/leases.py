@@ -0,0 +1,31 @@
+"""Time-limited leases stored in Mongo, so one worker runs each background job.
+
+A lease is a document `{_id: <job>, owner, until}`. A worker takes it when it
+is free or expired, or renews it when it already holds it. When another
+worker holds a live lease, the upsert collides on `_id` and the call returns
+False. If the holder dies, its lease lapses and another worker takes over.
+"""
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+
+def new_owner() -> str:
+    return f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+async def acquire_lease(collection, lease_id: str, owner: str, duration: timedelta,
+                        now: Optional[datetime] = None) -> bool:
+    now = now or datetime.utcnow()
+    try:
+        await collection.find_one_and_update(
+            {"_id": lease_id, "$or": [{"until": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "until": now + duration}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
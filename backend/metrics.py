@@ -0,0 +1,172 @@
+"""Prometheus instrumentation for the API.
+
+* `MetricsMiddleware` records per-route latency, in-flight requests and
+  response sizes, labelled by the route template rather than the raw path.
+* `MongoCommandListener` times every Mongo command via pymongo's command
+  monitoring, labelled by collection and command name.
+* `track_cache` / `track_vote_buffer` export the in-process caches as gauges
+  that are read at scrape time.
+* `WRITES_REJECTED` counts duplicate votes and throttled writes turned away
+  before they reach Mongo.
+
+With several workers, entrypoint.sh sets `PROMETHEUS_MULTIPROC_DIR`. Every
+worker then writes its samples to files in that directory, and `/metrics`
+aggregates all of them with a `MultiProcessCollector`, whichever worker
+serves the scrape. Function gauges cannot be read across processes, so in
+that mode each worker samples its own at most once a second after a request.
+"""
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess,
+)
+from pymongo import monitoring
+from starlette.responses import Response
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency",
+    ["method", "route", "status"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being served", ["method"], multiprocess_mode="livesum",
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "HTTP response body size", ["method", "route"],
+    buckets=(100, 1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000),
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command duration",
+    ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands", ["collection", "command"],
+)
+# Per-worker caches keep a pid label in multiprocess mode; buffer gauges add up across workers
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Hit ratio of an in-process cache", ["cache"], multiprocess_mode="liveall")
+CACHE_ENTRIES = Gauge("cache_entries", "Entries held by an in-process cache", ["cache"], multiprocess_mode="liveall")
+VOTE_BUFFER_PENDING_VOTES = Gauge(
+    "vote_buffer_pending_votes", "Votes waiting to be flushed", multiprocess_mode="livesum",
+)
+VOTE_BUFFER_PENDING_FORMATIONS = Gauge(
+    "vote_buffer_pending_formations", "Formations with unflushed votes", multiprocess_mode="livesum",
+)
+VOTE_BUFFER_FLUSH_LAG = Gauge(
+    "vote_buffer_flush_lag_seconds", "Age of the oldest unflushed vote", multiprocess_mode="livemax",
+)
+WRITES_REJECTED = Counter("writes_rejected_total", "Writes rejected in memory before reaching Mongo", ["reason"])
+
+UNMATCHED_ROUTE = "unmatched"
+SAMPLE_INTERVAL = 1.0
+
+# (gauge, function) pairs sampled into the shared files in multiprocess mode
+_sampled = []
+_sampled_at = 0.0
+
+
+def _track(gauge, function):
+    if MULTIPROCESS:
+        _sampled.append((gauge, function))
+    else:
+        gauge.set_function(function)
+
+
+def sample_gauges(now: float):
+    global _sampled_at
+    if _sampled and now - _sampled_at >= SAMPLE_INTERVAL:
+        _sampled_at = now
+        for gauge, function in _sampled:
+            gauge.set(function())
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        # The route template is only known after routing, so in-flight is per method
+        in_flight = REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", UNMATCHED_ROUTE)
+            finished = time.perf_counter()
+            REQUEST_LATENCY.labels(method, template, str(status)).observe(finished - started)
+            RESPONSE_SIZE.labels(method, template).observe(size)
+            sample_gauges(finished)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self):
+        self._started = {}
+
+    def started(self, event):
+        # getMore names the collection separately; its first value is the cursor id
+        key = "collection" if event.command_name == "getMore" else event.command_name
+        collection = event.command.get(key)
+        if not isinstance(collection, str):
+            collection = event.database_name
+        self._started[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event):
+        collection = self._started.pop((event.connection_id, event.request_id), event.database_name)
+        return collection, event.command_name
+
+    def succeeded(self, event):
+        collection, command = self._finish(event)
+        MONGO_COMMAND_DURATION.labels(collection, command).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection, command = self._finish(event)
+        MONGO_COMMAND_DURATION.labels(collection, command).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(collection, command).inc()
+
+
+def track_cache(name: str, cache):
+    _track(CACHE_HIT_RATIO.labels(name), lambda: cache.hit_ratio)
+    _track(CACHE_ENTRIES.labels(name), lambda: len(cache))
+
+
+def track_vote_buffer(vote_buffer):
+    _track(VOTE_BUFFER_PENDING_VOTES, lambda: vote_buffer.stats()["pending_votes"])
+    _track(VOTE_BUFFER_PENDING_FORMATIONS, lambda: vote_buffer.stats()["pending_formations"])
+    _track(VOTE_BUFFER_FLUSH_LAG, lambda: vote_buffer.stats()["flush_lag_seconds"])
+
+
+def metrics_response() -> Response:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_exited():
+    """Drop this worker's live gauges from the aggregate; called on shutdown."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,143 @@
+"""Optimal XI selection as an assignment problem.
+
+Slots of a formation are rows, candidate players are columns, and the score
+of a cell is the player's rating when their position is compatible with the
+slot's role. The best XI is the maximum-weight matching, which is found with
+a NumPy implementation of the Hungarian algorithm (shortest augmenting path
+with potentials, O(slots^2 * candidates)).
+
+Only the top `len(slots)` players of each position can appear in an optimal
+XI, so candidates are pre-bucketed per position with small indexed queries
+and the matrix never grows past a few hundred columns, whatever the size of
+the catalog.
+"""
+import asyncio
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Slot -> role, mirroring FORMATIONS in frontend/src/App.js
+FORMATION_SLOTS: Dict[str, Dict[str, str]] = {
+    "4-3-3": {
+        "GK": "GK", "CB1": "CB", "CB2": "CB", "LB": "LB", "RB": "RB",
+        "CM1": "CM", "CM2": "CM", "CM3": "CM", "LW": "LW", "RW": "RW", "ST": "ST",
+    },
+    "4-4-2": {
+        "GK": "GK", "CB1": "CB", "CB2": "CB", "LB": "LB", "RB": "RB",
+        "LM": "LM", "CM1": "CM", "CM2": "CM", "RM": "RM", "ST1": "ST", "ST2": "ST",
+    },
+}
+
+# Role -> player positions allowed to fill it; same lines as randomizeFormation
+POSITION_COMPATIBILITY: Dict[str, List[str]] = {
+    "GK": ["GK"],
+    "CB": ["CB", "LB", "RB"],
+    "LB": ["LB", "CB", "RB"],
+    "RB": ["RB", "CB", "LB"],
+    "CM": ["CM", "DM", "AM"],
+    "LM": ["LW", "CM", "AM"],
+    "RM": ["RW", "CM", "AM"],
+    "LW": ["LW", "RW", "ST"],
+    "RW": ["RW", "LW", "ST"],
+    "ST": ["ST", "LW", "RW"],
+}
+
+# Cost of leaving a slot for an incompatible player; an empty slot (cost 0) is preferred
+INCOMPATIBLE_COST = 1e6
+
+
+def hungarian(cost: np.ndarray) -> np.ndarray:
+    """Minimum-cost assignment of every row of `cost` (n x m, n <= m) to a distinct column."""
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)  # owner[j]: 1-based row matched to column j
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for row in range(1, n + 1):
+        owner[0] = row
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+
+    assignment = np.full(n, -1, dtype=np.int64)
+    matched = np.nonzero(owner[1:])[0]
+    assignment[owner[1:][matched] - 1] = matched
+    return assignment
+
+
+def positions_for(roles: Sequence[str], compatibility: Dict[str, List[str]]) -> List[str]:
+    return sorted({position for role in roles for position in compatibility.get(role, [])})
+
+
+def solve_xi(
+    slots: Dict[str, str],
+    candidates: List[dict],
+    compatibility: Optional[Dict[str, List[str]]] = None,
+) -> Dict[str, Optional[dict]]:
+    """Assign candidates to `slots` (slot -> role) maximizing the total rating."""
+    compatibility = compatibility or POSITION_COMPATIBILITY
+    slot_names = list(slots)
+    if not slot_names:
+        return {}
+
+    positions = sorted({c["position"] for c in candidates} | set(positions_for(slots.values(), compatibility)))
+    position_index = {position: i for i, position in enumerate(positions)}
+    # roles x positions compatibility table, then slots x candidates score matrix
+    allowed = np.zeros((len(slot_names), len(positions)), dtype=bool)
+    for i, slot in enumerate(slot_names):
+        for position in compatibility.get(slots[slot], []):
+            allowed[i, position_index[position]] = True
+
+    ratings = np.array([c["rating"] for c in candidates], dtype=float)
+    candidate_positions = np.array([position_index[c["position"]] for c in candidates], dtype=np.int64)
+    compatible = allowed[:, candidate_positions] if candidates else allowed[:, :0]
+    cost = np.where(compatible, -ratings, INCOMPATIBLE_COST)
+    # One "empty" column per slot keeps the problem feasible when candidates run out
+    cost = np.hstack([cost, np.zeros((len(slot_names), len(slot_names)))])
+
+    assignment = hungarian(cost)
+    xi = {}
+    for i, slot in enumerate(slot_names):
+        column = assignment[i]
+        if column < len(candidates) and compatible[i, column]:
+            xi[slot] = candidates[column]
+        else:
+            xi[slot] = None
+    return xi
+
+
+async def load_candidates(collection, filter_dict: dict, positions: Sequence[str], per_position: int,
+                          projection: dict, exclude_ids: Sequence[str] = ()) -> List[dict]:
+    """Top `per_position` players by rating for each position, one indexed query each."""
+    async def bucket(position):
+        # $and keeps any position restriction coming from the theme criteria
+        query = {"$and": [filter_dict, {"position": position}]} if filter_dict else {"position": position}
+        if exclude_ids:
+            query["id"] = {"$nin": list(exclude_ids)}
+        cursor = collection.find(query, projection).sort("rating", -1).limit(per_position)
+        return await cursor.to_list(per_position)
+
+    buckets = await asyncio.gather(*(bucket(position) for position in positions))
+    return [player for players in buckets for player in players]
@@ -0,0 +1,99 @@
+"""Bounded in-process cache for the player catalog.
+
+Entries are evicted least-recently-used once the total weight (number of
+cached players) passes the cap. Concurrent misses on the same key share a
+single load, and `invalidate` drops everything, including loads that were
+already in flight when a write happened.
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class CatalogCache:
+    def __init__(self, max_weight: int = 50000):
+        self.max_weight = max_weight
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight = {}
+        self._weight = 0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def weight(self) -> int:
+        return self._weight
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def peek(self, key: Hashable, default=None):
+        """Return a cached value without loading it on a miss."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        weight: Callable[[Any], int] = lambda value: 1,
+    ):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody was waiting
+            raise
+        else:
+            future.set_result(value)
+            # A write landed while we were loading; the value may already be stale
+            if generation == self._generation:
+                self._put(key, value, weight(value))
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _put(self, key, value, weight: int):
+        if weight > self.max_weight:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._weight -= old[1]
+        self._entries[key] = (value, weight)
+        self._weight += weight
+        while self._weight > self.max_weight:
+            _, (_, evicted_weight) = self._entries.popitem(last=False)
+            self._weight -= evicted_weight
+
+    def invalidate(self):
+        self._entries.clear()
+        self._inflight.clear()
+        self._weight = 0
+        self._generation += 1
@@ -0,0 +1,104 @@
+"""Per-client token-bucket rate limiting for the write routes.
+
+Every client key gets a bucket of `burst` tokens that refills at `rate`
+tokens per second, and each write request takes one token. Buckets are held
+in an LRU map capped at `max_clients`. An evicted client comes back with a
+full bucket, so the cap bounds memory without ever throttling harder.
+
+`RateLimitMiddleware` rejects over-limit writes with a 429 and a
+`Retry-After` header before routing, so they never reach Mongo.
+
+Clients are keyed by their address. `X-Real-IP` is honoured only when the
+peer is a trusted proxy, which by default means loopback, where nginx runs.
+Otherwise anyone who reaches the backend port directly could pick a new
+identity for every request.
+"""
+import ipaddress
+import math
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple, Union
+
+from starlette.responses import JSONResponse
+
+
+class TokenBucketLimiter:
+    def __init__(self, rate: float, burst: int, max_clients: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, updated_at]
+
+    def acquire(self, key: str) -> float:
+        """Take a token for `key`; returns 0 on success, else the seconds until one is available."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+Networks = Tuple[Union[ipaddress.IPv4Network, ipaddress.IPv6Network], ...]
+DEFAULT_TRUSTED_PROXIES = "127.0.0.1/8,::1/128"
+
+
+def parse_networks(spec: str) -> Networks:
+    """Comma-separated addresses or CIDR ranges."""
+    return tuple(ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip())
+
+
+def _is_trusted(address: str, trusted: Networks) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted)
+
+
+def client_key(scope, trusted_proxies: Networks = parse_networks(DEFAULT_TRUSTED_PROXIES)) -> str:
+    """The caller's address: X-Real-IP when a trusted proxy sent it, else the peer address."""
+    client: Optional[tuple] = scope.get("client")
+    peer = client[0] if client else None
+    if peer is not None and _is_trusted(peer, trusted_proxies):
+        for name, value in scope["headers"]:
+            if name == b"x-real-ip":
+                return value.decode("latin-1")
+    return peer or "unknown"
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limiter: TokenBucketLimiter, methods: Iterable[str] = ("POST", "PUT", "PATCH", "DELETE"),
+                 on_reject=None, trusted_proxies: Networks = parse_networks(DEFAULT_TRUSTED_PROXIES)):
+        self.app = app
+        self.limiter = limiter
+        self.trusted_proxies = trusted_proxies
+        self.methods = frozenset(methods)
+        self.on_reject = on_reject
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in self.methods:
+            await self.app(scope, receive, send)
+            return
+        retry_after = self.limiter.acquire(client_key(scope, self.trusted_proxies))
+        if retry_after:
+            if self.on_reject:
+                self.on_reject()
+            response = JSONResponse(
+                {"detail": "Too many requests"}, status_code=429,
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -0,0 +1,63 @@
+"""Startup phases, readiness and cache warm-up.
+
+The startup hook runs each phase inside `readiness.phase(name)`, which logs
+its duration and keeps it for `/api/readyz`. The app reports ready only
+after every phase has finished. `warm_up` replays the hot GET routes
+in-process through httpx's ASGI transport, so the caches are filled through
+exactly the same code paths and cache keys as real traffic.
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.ready = False
+        self._started: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        if self._started is None:
+            self._started = time.perf_counter()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.phases[name] = round(elapsed, 3)
+            logger.info("Startup phase %s took %.3fs", name, elapsed)
+
+    def mark_ready(self):
+        self.ready = True
+        total = time.perf_counter() - self._started if self._started is not None else 0.0
+        self.phases["total"] = round(total, 3)
+        logger.info("Ready after %.3fs", total)
+
+    def report(self) -> dict:
+        return {"status": "ready" if self.ready else "starting", "phases": self.phases}
+
+
+async def warm_up(app, paths: Sequence[str]) -> Dict[str, int]:
+    """GET every path through the app itself; returns the status code per path."""
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://warm-up") as client:
+        responses = await asyncio.gather(*(client.get(path) for path in paths), return_exceptions=True)
+
+    statuses = {}
+    for path, response in zip(paths, responses):
+        if isinstance(response, Exception):
+            logger.warning("Warm-up of %s failed: %s", path, response)
+            statuses[path] = 0
+        else:
+            if response.status_code >= 400:
+                logger.warning("Warm-up of %s returned %d", path, response.status_code)
+            statuses[path] = response.status_code
+    return statuses
@@ -0,0 +1,141 @@
+"""Retention for themes and formations, so hot queries only see the working set.
+
+Stale daily themes expire through a TTL index. When `get_daily_theme` creates
+the default theme, it sets `expires_at` on it. `RetentionJob` clears that
+field on one document of every default theme name that some formation uses.
+Default themes share their name from day to day, so any other copies of that
+name still expire. Only themes that nothing refers to are ever deleted.
+
+Old formations move to an archive collection. A formation is archived when it
+is older than `archive_after` and has fewer than `max_votes` votes. It is
+copied to `archive` and then removed from `formations`. The delete repeats the
+vote condition, so a formation voted past the threshold in the meantime stays
+live and its archive copy is dropped. The archive has the same indexes as
+`formations`, and routes read it only when asked to.
+
+The job runs every `interval` seconds on the worker that holds its lease.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+
+from leases import acquire_lease, new_owner
+
+logger = logging.getLogger(__name__)
+
+LEASE_ID = "retention"
+
+
+class RetentionJob:
+    def __init__(self, formations, archive, themes, jobs, archive_after: timedelta, max_votes: int,
+                 interval: float = 3600.0, batch_size: int = 1000,
+                 on_archive: Optional[Callable[[List[str]], None]] = None,
+                 on_themes_expired: Optional[Callable[[], None]] = None):
+        self.formations = formations
+        self.archive = archive
+        self.themes = themes
+        self.jobs = jobs
+        self.archive_after = archive_after
+        self.max_votes = max_votes
+        self.interval = interval
+        self.batch_size = batch_size
+        self.on_archive = on_archive
+        self.on_themes_expired = on_themes_expired
+        self.owner = new_owner()
+        self._next_expiry: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self.archived = 0
+
+    async def _needs_pin(self, name: str) -> bool:
+        if await self.themes.find_one({"name": name, "expires_at": {"$exists": False}}, {"_id": 1}):
+            return False  # already kept under this name
+        return bool(
+            await self.formations.find_one({"theme": name}, {"_id": 1})
+            or await self.archive.find_one({"theme": name}, {"_id": 1})
+        )
+
+    async def pin_used_daily_themes(self, now: Optional[datetime] = None) -> int:
+        """Keep the newest expiring theme of every name that formations use; returns how many were pinned."""
+        now = now or datetime.utcnow()
+        if self._next_expiry is not None and self._next_expiry <= now:
+            # The TTL monitor deleted a theme since the last run; cached theme lists are stale
+            if self.on_themes_expired:
+                self.on_themes_expired()
+        newest = {}
+        expiries = []
+        cursor = self.themes.find({"expires_at": {"$exists": True}}, {"_id": 0, "id": 1, "name": 1, "expires_at": 1})
+        async for theme in cursor.sort("date", -1):
+            if theme["name"] not in newest:
+                newest[theme["name"]] = theme
+            else:
+                expiries.append(theme["expires_at"])
+        pinned = []
+        for name, theme in newest.items():
+            if await self._needs_pin(name):
+                pinned.append(theme["id"])
+            else:
+                expiries.append(theme["expires_at"])
+        if pinned:
+            await self.themes.update_many({"id": {"$in": pinned}}, {"$unset": {"expires_at": ""}})
+        self._next_expiry = min(expiries, default=None)
+        return len(pinned)
+
+    async def archive_formations(self, now: Optional[datetime] = None) -> int:
+        """Move old, rarely voted formations to the archive; returns how many moved."""
+        now = now or datetime.utcnow()
+        stale = {"created_at": {"$lt": now - self.archive_after}, "votes": {"$lt": self.max_votes}}
+        moved = 0
+        while True:
+            batch = await self.formations.find(stale, {"_id": 0}).limit(self.batch_size).to_list(self.batch_size)
+            if not batch:
+                break
+            ids = [doc["id"] for doc in batch]
+            # Copy first: a crash between the two steps leaves a duplicate, never a loss
+            await self.archive.bulk_write(
+                [ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in batch], ordered=False
+            )
+            await self.formations.delete_many({"id": {"$in": ids}, **stale})
+            kept = [doc["id"] async for doc in self.formations.find({"id": {"$in": ids}}, {"_id": 0, "id": 1})]
+            if kept:
+                await self.archive.delete_many({"id": {"$in": kept}})
+            kept_ids = set(kept)
+            archived = [formation_id for formation_id in ids if formation_id not in kept_ids]
+            moved += len(archived)
+            if archived and self.on_archive:
+                self.on_archive(archived)
+            if len(batch) < self.batch_size:
+                break
+        if moved:
+            logger.info("Archived %d formations", moved)
+        self.archived += moved
+        return moved
+
+    async def run_once(self):
+        await self.pin_used_daily_themes()
+        await self.archive_formations()
+
+    async def _run(self):
+        while True:
+            try:
+                if await acquire_lease(self.jobs, LEASE_ID, self.owner, timedelta(seconds=2 * self.interval)):
+                    await self.run_once()
+            except PyMongoError:
+                logger.exception("Retention job failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,253 @@
+"""In-process typeahead index over player names.
+
+Names are folded to lowercase ASCII ("Luka Modrić" -> "luka modric") and
+split into tokens. Each query token is matched against the sorted token
+vocabulary by prefix (bisect over a sorted list). When a token has no prefix
+match it falls back to fuzzy matching, ranking vocabulary tokens by trigram
+Dice similarity. Candidates come from the most selective query token and are
+then checked against the remaining tokens, so every query token must match.
+Results are ranked by match quality and then rating.
+
+Postings are kept sorted by rating, so broad prefixes ("a") only look at the
+best-rated `max_candidates` players and each keystroke costs a bounded amount
+of work.
+"""
+import asyncio
+import heapq
+import logging
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+SEARCH_FIELDS = ("id", "name", "position", "club", "country", "rating", "image_url", "era")
+RATING = SEARCH_FIELDS.index("rating")
+TOKENS = len(SEARCH_FIELDS)  # rows carry the folded name tokens after the fields
+
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+FUZZY_THRESHOLD = 0.45
+FUZZY_TOKENS = 20
+PREFIX_TOKENS = 200
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+logger = logging.getLogger(__name__)
+
+
+def fold(text: str) -> str:
+    """Lowercase, strip accents and punctuation: 'Ronaldo Nazário' -> 'ronaldo nazario'."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    ascii_text = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", ascii_text.lower()).strip()
+
+
+def trigrams(token: str) -> List[str]:
+    padded = f"${token}$"
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def dice(grams: set, token: str) -> float:
+    other = set(trigrams(token))
+    return 2 * len(grams & other) / (len(grams) + len(other))
+
+
+class PlayerSearchIndex:
+    def __init__(self, max_candidates: int = 5000):
+        self.max_candidates = max_candidates
+        self._players: List[Optional[tuple]] = []
+        self._slot: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._tokens: List[str] = []
+        self._trigrams: Dict[str, set] = defaultdict(set)
+        self._ready = asyncio.Event()
+        self._pending: Optional[List[dict]] = None
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._rebuild_again = False
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def __len__(self):
+        return len(self._slot)
+
+    def _rating_key(self, slot: int) -> int:
+        return -self._players[slot][RATING]
+
+    def _add_token(self, token: str, slot: int):
+        postings = self._postings.get(token)
+        if postings is None:
+            postings = self._postings[token] = []
+            insort(self._tokens, token)
+            for gram in trigrams(token):
+                self._trigrams[gram].add(token)
+        insort(postings, slot, key=self._rating_key)
+
+    @staticmethod
+    def _row(player: dict) -> tuple:
+        tokens = tuple(sorted(set(fold(player["name"]).split())))
+        return tuple(player.get(field) for field in SEARCH_FIELDS) + (tokens,)
+
+    def _remove(self, player_id: str):
+        slot = self._slot.pop(player_id, None)
+        if slot is None:
+            return
+        for token in self._players[slot][TOKENS]:
+            postings = self._postings[token]
+            postings.remove(slot)
+            if not postings:
+                del self._postings[token]
+                del self._tokens[bisect_left(self._tokens, token)]
+                for gram in trigrams(token):
+                    self._trigrams[gram].discard(token)
+        self._players[slot] = None
+
+    def add(self, player: dict):
+        """Index (or re-index) a player document."""
+        if self._pending is not None:
+            # Replayed on top of the snapshot once the running rebuild swaps in
+            self._pending.append(player)
+        self._remove(player["id"])
+        slot = len(self._players)
+        row = self._row(player)
+        self._players.append(row)
+        self._slot[player["id"]] = slot
+        for token in row[TOKENS]:
+            self._add_token(token, slot)
+
+    def _build(self, players: List[dict]):
+        # Bulk build: sort once instead of one insort per token
+        rows = [self._row(p) for p in players]
+        slot_of = {row[0]: i for i, row in enumerate(rows)}
+        rows = [row if slot_of[row[0]] == i else None for i, row in enumerate(rows)]
+        postings = defaultdict(list)
+        for slot, row in enumerate(rows):
+            if row is not None:
+                for token in row[TOKENS]:
+                    postings[token].append(slot)
+        for token_postings in postings.values():
+            token_postings.sort(key=lambda slot: -rows[slot][RATING])
+        grams = defaultdict(set)
+        for token in postings:
+            for gram in trigrams(token):
+                grams[gram].add(token)
+        return rows, slot_of, postings, sorted(postings), grams
+
+    async def rebuild(self, collection):
+        """Reload from Mongo; the structures are built off the event loop and swapped in."""
+        projection = {"_id": 0, **{field: 1 for field in SEARCH_FIELDS}}
+        self._pending = []
+        try:
+            players = [doc async for doc in collection.find({}, projection).batch_size(10000)]
+            built = await asyncio.to_thread(self._build, players)
+            self._players, self._slot, self._postings, self._tokens, self._trigrams = built
+            pending, self._pending = self._pending, None
+            for player in pending:
+                self.add(player)
+        finally:
+            self._pending = None
+        self._ready.set()
+
+    def schedule_rebuild(self, collection):
+        """Rebuild in the background; calls made during a rebuild coalesce into one more pass."""
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            self._rebuild_again = True
+            return
+        self._rebuild_task = asyncio.get_running_loop().create_task(self._rebuild_loop(collection))
+
+    async def _rebuild_loop(self, collection, retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        delay = retry_delay
+        while True:
+            self._rebuild_again = False
+            try:
+                await self.rebuild(collection)
+            except Exception:
+                logger.exception("Player search index rebuild failed")
+                if not self.ready:
+                    # Nothing to serve yet: retry with backoff rather than wait for the next write
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, max_retry_delay)
+                    continue
+            if not self._rebuild_again:
+                return
+
+    def _prefix_tokens(self, prefix: str) -> List[str]:
+        start = bisect_left(self._tokens, prefix)
+        matches = []
+        for token in self._tokens[start:start + PREFIX_TOKENS]:
+            if not token.startswith(prefix):
+                break
+            matches.append(token)
+        return matches
+
+    def _fuzzy_tokens(self, query_token: str) -> List[Tuple[str, float]]:
+        grams = trigrams(query_token)
+        shared = Counter()
+        for gram in set(grams):
+            shared.update(self._trigrams.get(gram, ()))
+        scored = []
+        for token, count in shared.items():
+            dice = 2 * count / (len(grams) + len(token))
+            if dice >= FUZZY_THRESHOLD:
+                scored.append((token, dice))
+        return heapq.nlargest(FUZZY_TOKENS, scored, key=lambda item: item[1])
+
+    def _token_matches(self, query_token: str) -> List[Tuple[str, float]]:
+        """Vocabulary tokens matching `query_token`, with their match score."""
+        matches = [(token, EXACT_SCORE if token == query_token else PREFIX_SCORE)
+                   for token in self._prefix_tokens(query_token)]
+        if not matches and len(query_token) >= 3:
+            matches = self._fuzzy_tokens(query_token)
+        return matches
+
+    def _candidates(self, matches: List[Tuple[str, float]]) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for token, score in matches:
+            for slot in self._postings[token][:self.max_candidates]:
+                if scores.get(slot, 0) < score:
+                    scores[slot] = score
+            if len(scores) >= self.max_candidates:
+                break
+        return scores
+
+    @staticmethod
+    def _verify(query_token: str, tokens: tuple) -> float:
+        """Score of the best of a candidate's name tokens for `query_token`, 0 when none match."""
+        if query_token in tokens:
+            return EXACT_SCORE
+        if any(token.startswith(query_token) for token in tokens):
+            return PREFIX_SCORE
+        if len(query_token) < 3:
+            return 0.0
+        grams = set(trigrams(query_token))
+        best = max(dice(grams, token) for token in tokens) if tokens else 0.0
+        return best if best >= FUZZY_THRESHOLD else 0.0
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        query_tokens = list(dict.fromkeys(fold(query).split()))
+        if not query_tokens:
+            return []
+        matched = [self._token_matches(token) for token in query_tokens]
+        # Drive from the most selective prefix-matched token, verify the others per candidate
+        driver = min(range(len(matched)), key=lambda i: (
+            not any(score >= PREFIX_SCORE for _, score in matched[i]),
+            sum(len(self._postings[token]) for token, _ in matched[i]),
+        ))
+        others = [token for i, token in enumerate(query_tokens) if i != driver]
+        totals = {}
+        for slot, score in self._candidates(matched[driver]).items():
+            tokens = self._players[slot][TOKENS]
+            for query_token in others:
+                token_score = self._verify(query_token, tokens)
+                if not token_score:
+                    break
+                score += token_score
+            else:
+                totals[slot] = score
+        best = heapq.nlargest(limit, totals.items(), key=lambda item: (item[1], self._players[item[0]][RATING]))
+        return [dict(zip(SEARCH_FIELDS, self._players[slot])) for slot, _ in best]
+
+    async def wait_ready(self):
+        await self._ready.wait()
@@ -0,0 +1,123 @@
+"""Trusted fast-path JSON encoding for list responses.
+
+Documents read from our own collections were validated when they were
+written, so list routes hand them (or the models already held in the
+in-process caches) straight to orjson. Returning a `TrustedJSONResponse`
+also skips FastAPI's `response_model` re-validation; the model stays on the
+route for the OpenAPI schema only.
+
+`negotiated_response` picks the wire format from the Accept header:
+
+    application/json                        (default)
+    application/msgpack                     MessagePack, same shape as the JSON
+    application/vnd.columnar+json           lists as {"fields": [...], "columns": [[...], ...]}
+
+In the columnar layout, field names are written once and each column holds
+the values of one field for every row, in row order.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import msgpack
+import orjson
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+COLUMNAR_MEDIA_TYPE = "application/vnd.columnar+json"
+WIRE_FORMATS = {
+    "application/json": "json",
+    MSGPACK_MEDIA_TYPE: "msgpack",
+    "application/x-msgpack": "msgpack",
+    COLUMNAR_MEDIA_TYPE: "columnar",
+}
+
+
+def _default(obj):
+    if isinstance(obj, BaseModel):
+        # Field values as stored, nested models are encoded through this hook again
+        return obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    if isinstance(obj, datetime):
+        # Same ISO strings as the JSON encoding
+        return obj.isoformat()
+    raise TypeError(f"Type is not MessagePack serializable: {type(obj).__name__}")
+
+
+def packb(content) -> bytes:
+    return msgpack.packb(content, default=_msgpack_default)
+
+
+def columnar(rows: List) -> Dict[str, list]:
+    """Column-oriented layout of a list of documents or models."""
+    rows = [row.__dict__ if isinstance(row, BaseModel) else row for row in rows]
+    fields = {}
+    for row in rows:
+        for field in row:
+            fields.setdefault(field)
+    return {"fields": list(fields), "columns": [[row.get(field) for row in rows] for field in fields]}
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Wire format for an Accept header: the highest-q supported media type, JSON otherwise."""
+    best, best_q = "json", 0.0
+    for entry in (accept or "").split(","):
+        media_type, _, params = entry.partition(";")
+        wire_format = WIRE_FORMATS.get(media_type.strip().lower())
+        if wire_format is None:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = wire_format, q
+    return best
+
+
+def model_projection(model) -> dict:
+    """Mongo projection limited to the fields of `model`, without `_id`."""
+    return {"_id": 0, **{field: 1 for field in model.model_fields}}
+
+
+class TrustedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class MsgpackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content) -> bytes:
+        return packb(content)
+
+
+class ColumnarJSONResponse(TrustedJSONResponse):
+    media_type = COLUMNAR_MEDIA_TYPE
+
+    def render(self, content) -> bytes:
+        return dumps(columnar(content))
+
+
+def negotiated_response(request: Request, content, headers: Optional[dict] = None) -> Response:
+    """Trusted response in the format the client asked for; columnar applies to lists only."""
+    wire_format = negotiate(request.headers.get("accept"))
+    if wire_format == "msgpack":
+        return MsgpackResponse(content, headers=headers)
+    if wire_format == "columnar" and isinstance(content, list):
+        return ColumnarJSONResponse(content, headers=headers)
+    return TrustedJSONResponse(content, headers=headers)
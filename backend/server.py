@@ -1,29 +1,214 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 import uuid
-from datetime import datetime
+import json
+import base64
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from indexes import reconcile_indexes, assert_no_collscan
+from player_cache import CatalogCache
+from vote_buffer import VoteBuffer
+from leaderboard import Leaderboard
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure, PyMongoError
+from ingest import iter_records, ingest_players
+from dataloader import DataLoader
+from daily_theme import DailyThemeResolver
+from serialization import dumps, model_projection, negotiated_response
+from optimizer import FORMATION_SLOTS, POSITION_COMPATIBILITY, load_candidates, positions_for, solve_xi
+from criteria import CriteriaError, EligibilityIndex, compile_criteria
+from metrics import (
+    WRITES_REJECTED, MetricsMiddleware, MongoCommandListener, mark_worker_exited, metrics_response, track_cache,
+    track_vote_buffer,
+)
+from search_index import PlayerSearchIndex
+from etags import CollectionVersions, ConditionalGetMiddleware
+from compression import CompressionMiddleware
+from coherence import CoherenceMiddleware, SharedCounters, SharedVoteLog, default_path, theme_hash
+from vote_stream import ChangeStreamSource, VoteHub
+from vote_dedup import DailyBloomFilter, SharedDailyBloomFilter, default_dedup_path
+from rate_limit import DEFAULT_TRUSTED_PROXIES, RateLimitMiddleware, TokenBucketLimiter, client_key, parse_networks
+from readiness import Readiness, warm_up
+from formation_stats import backfill_aggregates, formation_aggregates
+from trending import TrendingRankings
+from retention import RetentionJob
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# connect=False: nothing touches the network at import; the startup ping opens the first connection
+client = AsyncIOMotorClient(mongo_url, connect=False, event_listeners=[MongoCommandListener()])
 db = client[os.environ['DB_NAME']]
 
+# Per-collection version counters behind the ETags; every write path below bumps them.
+# With CACHE_COHERENCE=shm (set by entrypoint.sh for multi-worker runs) the counters live in
+# shared memory, and each worker drops its caches when another worker bumps them.
+# "rankings" changes only when formations leave the boards, which vote counts never do
+VERSIONED_COLLECTIONS = ("players", "formations", "themes", "rankings")
+CACHE_COHERENCE = os.environ.get('CACHE_COHERENCE', '').lower()
+shared_versions = SharedCounters(
+    os.environ.get('VERSION_FILE', default_path()), VERSIONED_COLLECTIONS
+) if CACHE_COHERENCE == 'shm' else None
+collection_versions = CollectionVersions(VERSIONED_COLLECTIONS, shared=shared_versions)
+# New vote counts for the other workers' leaderboards, appended before each "formations" bump
+vote_log = SharedVoteLog(
+    os.environ.get('VOTE_LOG_FILE', default_path("dream11-vote-log")),
+    capacity=int(os.environ.get('VOTE_LOG_CAPACITY', 4096)),
+) if shared_versions else None
+
+# Player catalog cache, invalidated by every player write below
+player_cache = CatalogCache(max_weight=int(os.environ.get('PLAYER_CACHE_MAX_ROWS', 50000)))
+
+track_cache("players", player_cache)
+
+# Eligible player ids per theme, compiled from each theme's filter_criteria
+theme_eligibility = EligibilityIndex(db.players)
+
+# Typeahead index over player names, rebuilt in the background after bulk loads
+player_search = PlayerSearchIndex()
+
+# How long a search waits for the first index build before answering 503
+SEARCH_READY_TIMEOUT = float(os.environ.get('SEARCH_READY_TIMEOUT', 2.0))
+
+def schedule_search_rebuild():
+    player_search.schedule_rebuild(db.players)
+
+# In-memory top-N rankings per theme, rebuilt on startup
+leaderboard = Leaderboard(size=int(os.environ.get('LEADERBOARD_SIZE', 100)))
+
+def share_ranking(formation):
+    """Re-rank `formation` here and log its vote count for the other workers."""
+    leaderboard.offer(formation)
+    if vote_log:
+        vote_log.append(formation.id, formation.theme, formation.votes)
+
+def apply_shared_votes():
+    records = vote_log.read_new()
+    if records is None:
+        # More records than the ring holds went by; reseed every board instead
+        leaderboard.invalidate()
+        return
+    for formation_id, votes, theme in records:
+        leaderboard.apply_votes(formation_id, votes, lambda name, theme=theme: theme_hash(name) == theme)
+
+async def refresh_rankings(formation_ids):
+    async for doc in db.formations.find({"id": {"$in": formation_ids}}, {"_id": 0}):
+        share_ranking(Formation(**doc))
+    collection_versions.bump("formations")
+
+# Optional write-behind buffering of formation votes
+VOTE_BUFFER_ENABLED = os.environ.get('VOTE_BUFFER_ENABLED', '').lower() in ('1', 'true', 'yes')
+vote_buffer = VoteBuffer(
+    db.formations,
+    flush_interval=float(os.environ.get('VOTE_FLUSH_INTERVAL', 1.0)),
+    max_pending=int(os.environ.get('VOTE_FLUSH_MAX_PENDING', 1000)),
+    on_flush=refresh_rankings,
+) if VOTE_BUFFER_ENABLED else None
+if vote_buffer:
+    track_vote_buffer(vote_buffer)
+
+# Live vote deltas for /api/formations/stream. With FORMATION_CHANGE_STREAM the hub is fed
+# from a Mongo change stream (replica set only) so that every worker sees every write
+vote_hub = VoteHub(interval=float(os.environ.get('VOTE_STREAM_INTERVAL', 0.25)))
+FORMATION_CHANGE_STREAM = os.environ.get('FORMATION_CHANGE_STREAM', '').lower() in ('1', 'true', 'yes')
+change_stream_source = ChangeStreamSource(db.formations, vote_hub) if FORMATION_CHANGE_STREAM else None
+SSE_KEEPALIVE = 15.0
+
+# One vote per client and formation per UTC day, answered from a Bloom filter instead of Mongo
+VOTE_DEDUP_ENABLED = os.environ.get('VOTE_DEDUP_ENABLED', '1').lower() in ('1', 'true', 'yes')
+VOTE_DEDUP_CAPACITY = int(os.environ.get('VOTE_DEDUP_CAPACITY', 1_000_000))
+VOTE_DEDUP_ERROR_RATE = float(os.environ.get('VOTE_DEDUP_ERROR_RATE', 0.001))
+vote_dedup = None
+if VOTE_DEDUP_ENABLED:
+    # With shared-memory coherence, every worker checks votes against one filter
+    vote_dedup = SharedDailyBloomFilter(
+        os.environ.get('VOTE_DEDUP_FILE', default_dedup_path()), VOTE_DEDUP_CAPACITY, VOTE_DEDUP_ERROR_RATE,
+    ) if shared_versions else DailyBloomFilter(VOTE_DEDUP_CAPACITY, VOTE_DEDUP_ERROR_RATE)
+
+# Token bucket per client on every write route
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1').lower() in ('1', 'true', 'yes')
+# Peers whose X-Real-IP header is believed; everyone else is keyed by their own address
+TRUSTED_PROXIES = parse_networks(os.environ.get('TRUSTED_PROXIES', DEFAULT_TRUSTED_PROXIES))
+write_limiter = TokenBucketLimiter(
+    rate=float(os.environ.get('WRITE_RATE_LIMIT', 5)),
+    burst=int(os.environ.get('WRITE_RATE_BURST', 30)),
+) if RATE_LIMIT_ENABLED else None
+
 # Create the main app without a prefix
 app = FastAPI()
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Pagination / streaming settings for list routes
+PLAYERS_PAGE_SIZE = int(os.environ.get('PLAYERS_PAGE_SIZE', 1000))
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 500))
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(last_id: str) -> str:
+    """Opaque keyset cursor pointing just after `last_id`."""
+    raw = json.dumps({"id": last_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return json.loads(raw)["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def split_values(values: Optional[List[str]]) -> List[str]:
+    """Accept both repeated (?club=a&club=b) and comma separated (?club=a,b) params."""
+    return [v.strip() for value in values or [] for v in value.split(",") if v.strip()]
+
+def build_player_filter(position=None, club=None, era=None, country=None, min_rating=None, max_rating=None) -> dict:
+    filter_dict = {}
+    for field, values in (("position", position), ("club", club), ("era", era), ("country", country)):
+        values = split_values(values)
+        if len(values) == 1:
+            filter_dict[field] = values[0]
+        elif values:
+            filter_dict[field] = {"$in": values}
+    rating = {}
+    if min_rating is not None:
+        rating["$gte"] = min_rating
+    if max_rating is not None:
+        rating["$lte"] = max_rating
+    if rating:
+        filter_dict["rating"] = rating
+    return filter_dict
+
+def player_projection(fields: Optional[str]) -> Optional[dict]:
+    """Projection for `?fields=`; `id` is always included since cursors depend on it."""
+    if not fields:
+        return None
+    names = split_values([fields])
+    unknown = [name for name in names if name not in Player.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return {"_id": 0, "id": 1, **{name: 1 for name in names}}
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+async def stream_ndjson(cursor):
+    # Documents are written out as Motor yields them, one batch in memory at a time
+    async for document in cursor.batch_size(STREAM_BATCH_SIZE):
+        yield dumps(document) + b"\n"
+
 # Player Model
 class Player(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -61,6 +246,33 @@ class Formation(BaseModel):
     players: List[FormationPlayer]
     created_at: datetime = Field(default_factory=datetime.utcnow)
     votes: int = 0
+    # Team-quality aggregates, computed from the players when the formation is created
+    total_rating: int = 0
+    avg_rating: float = 0.0
+    line_ratings: Dict[str, float] = {}
+    countries: List[str] = []
+    eras: List[str] = []
+
+# Slim player data inlined into formations with ?expand=players
+class SlimPlayer(BaseModel):
+    id: str
+    name: str
+    position: str
+    club: str
+    country: str
+    rating: int
+    image_url: str
+    era: str
+
+class ExpandedFormationPlayer(FormationPlayer):
+    player: Optional[SlimPlayer] = None
+
+class ExpandedFormation(Formation):
+    players: List[ExpandedFormationPlayer]
+
+# Formation in a trending ranking, with its votes inside the window
+class TrendingFormation(Formation):
+    window_votes: int
 
 class FormationCreate(BaseModel):
     user_name: str
@@ -68,6 +280,30 @@ class FormationCreate(BaseModel):
     theme: str
     players: List[FormationPlayer]
 
+# Optimal XI request/response
+class OptimizeRequest(BaseModel):
+    formation_name: str
+    theme: Optional[str] = None  # name of a theme whose filter_criteria apply
+    filter_criteria: dict = {}
+    locked: Dict[str, str] = {}  # position_slot -> player_id
+    compatibility: Optional[Dict[str, List[str]]] = None  # role -> allowed player positions
+
+class OptimizedSlot(BaseModel):
+    position_slot: str
+    player: Optional[SlimPlayer] = None
+    locked: bool = False
+
+class OptimizedFormation(BaseModel):
+    formation_name: str
+    total_rating: int
+    players: List[OptimizedSlot]
+
+class FacetValue(BaseModel):
+    value: str
+    count: int
+
+FACET_FIELDS = ("position", "club", "country", "era")
+
 # Theme Model
 class Theme(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -83,99 +319,570 @@ class ThemeCreate(BaseModel):
     filter_criteria: dict
     is_daily: bool = True
 
+PLAYER_PROJECTION = model_projection(Player)
+FORMATION_PROJECTION = model_projection(Formation)
+THEME_PROJECTION = model_projection(Theme)
+
+# Trending rankings per window, rolled up from time-bucketed vote counters
+TRENDING_ENABLED = os.environ.get('TRENDING_ENABLED', '1').lower() in ('1', 'true', 'yes')
+trending = TrendingRankings(
+    db.vote_buckets,
+    db.trending,
+    db.jobs,
+    db.formations,
+    projection=FORMATION_PROJECTION,
+    bucket_minutes=int(os.environ.get('TRENDING_BUCKET_MINUTES', 5)),
+    rollup_interval=float(os.environ.get('TRENDING_ROLLUP_INTERVAL', 60.0)),
+    retention=timedelta(days=float(os.environ.get('TRENDING_RETENTION_DAYS', 8))),
+) if TRENDING_ENABLED else None
+
+def forget_archived_formations(formation_ids):
+    collection_versions.bump("formations", "rankings")
+    leaderboard.invalidate()
+    if vote_buffer:
+        for formation_id in formation_ids:
+            vote_buffer.forget(formation_id)
+
+# Old, rarely voted formations move to formations_archive; unused default daily themes expire
+RETENTION_ENABLED = os.environ.get('RETENTION_ENABLED', '1').lower() in ('1', 'true', 'yes')
+retention_job = RetentionJob(
+    db.formations,
+    db.formations_archive,
+    db.themes,
+    db.jobs,
+    archive_after=timedelta(days=float(os.environ.get('FORMATION_ARCHIVE_DAYS', 90))),
+    max_votes=int(os.environ.get('FORMATION_ARCHIVE_MAX_VOTES', 5)),
+    interval=float(os.environ.get('RETENTION_INTERVAL', 3600.0)),
+    on_archive=forget_archived_formations,
+    on_themes_expired=lambda: collection_versions.bump("themes"),
+) if RETENTION_ENABLED else None
+
 # Basic routes
 @api_router.get("/")
 async def root():
     return {"message": "Football Team Builder API"}
 
+# Startup phases and their timings, reported by /readyz
+readiness = Readiness()
+READY_PING_TIMEOUT = float(os.environ.get('READY_PING_TIMEOUT', 1.0))
+WARM_UP_PATHS = ("/api/players", "/api/players/facets", "/api/themes", "/api/themes/daily", "/api/formations")
+
+@api_router.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and its event loop answers."""
+    return {"status": "ok"}
+
+@api_router.get("/readyz")
+async def readyz():
+    """Readiness: startup finished (Mongo pinged, indexes reconciled, caches warm) and Mongo still answers."""
+    report = {**readiness.report(), "search_index": player_search.ready}
+    if not readiness.ready:
+        return JSONResponse(report, status_code=503)
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), READY_PING_TIMEOUT)
+    except (asyncio.TimeoutError, PyMongoError):
+        return JSONResponse({**report, "status": "mongo_unreachable"}, status_code=503)
+    return report
+
 # Player routes
 @api_router.post("/players", response_model=Player)
 async def create_player(player: PlayerCreate):
     player_dict = player.dict()
     player_obj = Player(**player_dict)
     await db.players.insert_one(player_obj.dict())
+    player_cache.invalidate()
+    collection_versions.bump("players")
+    theme_eligibility.add_player(player_obj.dict())
+    player_search.add(player_obj.dict())
     return player_obj
 
+@api_router.post("/players/bulk")
+async def bulk_create_players(
+    request: Request,
+    mode: Literal["insert", "upsert"] = "insert",
+    key: str = "name,country",
+):
+    """Load a streamed NDJSON or CSV body of PlayerCreate records."""
+    upsert_key = None
+    if mode == "upsert":
+        upsert_key = [field.strip() for field in key.split(",") if field.strip()]
+        unknown = [field for field in upsert_key if field not in PlayerCreate.model_fields]
+        if not upsert_key or unknown:
+            raise HTTPException(status_code=400, detail=f"Invalid natural key: {key}")
+
+    fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+
+    def validate(record: dict) -> dict:
+        return Player(**PlayerCreate(**record).dict()).dict()
+
+    result = await ingest_players(
+        db.players,
+        iter_records(request.stream(), fmt),
+        validate,
+        chunk_size=int(os.environ.get('BULK_CHUNK_SIZE', 1000)),
+        upsert_key=upsert_key,
+    )
+    if result.inserted or result.updated:
+        player_cache.invalidate()
+        collection_versions.bump("players")
+        theme_eligibility.invalidate()
+        schedule_search_rebuild()
+    return result.dict()
+
 @api_router.get("/players", response_model=List[Player])
-async def get_players(position: Optional[str] = None, club: Optional[str] = None, era: Optional[str] = None):
-    filter_dict = {}
-    if position:
-        filter_dict["position"] = position
-    if club:
-        filter_dict["club"] = club
-    if era:
-        filter_dict["era"] = era
-    
-    players = await db.players.find(filter_dict).to_list(1000)
-    return [Player(**player) for player in players]
+async def get_players(
+    request: Request,
+    position: Optional[List[str]] = Query(None),
+    club: Optional[List[str]] = Query(None),
+    era: Optional[List[str]] = Query(None),
+    country: Optional[List[str]] = Query(None),
+    min_rating: Optional[int] = Query(None, ge=0, le=100),
+    max_rating: Optional[int] = Query(None, ge=0, le=100),
+    theme: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=PLAYERS_PAGE_SIZE),
+):
+    filter_dict = build_player_filter(position, club, era, country, min_rating, max_rating)
+    projection = player_projection(fields) or PLAYER_PROJECTION
+    cache_key = ("players", json.dumps(filter_dict, sort_keys=True),
+                 json.dumps(projection, sort_keys=True), theme, cursor, limit)
+    after_id = decode_cursor(cursor) if cursor else None
+    page_size = limit or PLAYERS_PAGE_SIZE
+    ndjson = wants_ndjson(request)
+
+    theme_query = None
+    if theme:
+        theme_query = await theme_eligibility.resolve(theme, db.themes)
+        if theme_query is None:
+            raise HTTPException(status_code=404, detail="Theme not found")
+
+    if theme and not filter_dict and not ndjson:
+        # Theme pages are a slice of the materialized eligible-id list
+        async def load_theme_page():
+            eligible = await theme_eligibility.ids(theme)
+            start = bisect_right(eligible, after_id) if after_id else 0
+            window = eligible[start:start + page_size]
+            players = await db.players.find({"id": {"$in": window}}, projection).sort("id", 1).to_list(len(window))
+            next_cursor = encode_cursor(window[-1]) if len(eligible) > start + page_size else None
+            return players, next_cursor
+
+        players, next_cursor = await player_cache.get_or_load(
+            cache_key, load_theme_page, weight=lambda page: max(len(page[0]), 1)
+        )
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+        return negotiated_response(request, players, headers=headers)
+
+    if theme_query:
+        filter_dict = {"$and": [filter_dict, theme_query]} if filter_dict else dict(theme_query)
+    if after_id:
+        filter_dict["id"] = {"$gt": after_id}
+
+    # Keyset pagination on the unique player id keeps every page an index range scan
+    query = db.players.find(filter_dict, projection).sort("id", 1)
+
+    if ndjson:
+        if limit:
+            query = query.limit(limit)
+        return StreamingResponse(stream_ndjson(query), media_type=NDJSON_MEDIA_TYPE)
+
+    async def load_page():
+        players = await query.limit(page_size + 1).to_list(page_size + 1)
+        next_cursor = None
+        if len(players) > page_size:
+            players = players[:page_size]
+            next_cursor = encode_cursor(players[-1]["id"])
+        # Trusted read: documents were validated on write, so skip building models
+        return players, next_cursor
+
+    players, next_cursor = await player_cache.get_or_load(
+        cache_key, load_page, weight=lambda page: max(len(page[0]), 1)
+    )
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    return negotiated_response(request, players, headers=headers)
+
+@api_router.get("/players/facets", response_model=Dict[str, List[FacetValue]])
+async def get_player_facets(
+    request: Request,
+    position: Optional[List[str]] = Query(None),
+    club: Optional[List[str]] = Query(None),
+    era: Optional[List[str]] = Query(None),
+    country: Optional[List[str]] = Query(None),
+    min_rating: Optional[int] = Query(None, ge=0, le=100),
+    max_rating: Optional[int] = Query(None, ge=0, le=100),
+    theme: Optional[str] = None,
+):
+    """Distinct values with counts for the filter dropdowns, scoped by the same filters as GET /players."""
+    filter_dict = build_player_filter(position, club, era, country, min_rating, max_rating)
+    if theme:
+        theme_query = await theme_eligibility.resolve(theme, db.themes)
+        if theme_query is None:
+            raise HTTPException(status_code=404, detail="Theme not found")
+        filter_dict = {"$and": [filter_dict, theme_query]} if filter_dict else dict(theme_query)
+
+    async def load_facets():
+        # One pass over the matching players, one $group per facet
+        pipeline = [
+            {"$match": filter_dict},
+            {"$facet": {
+                field: [
+                    {"$match": {field: {"$type": "string", "$ne": ""}}},
+                    {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1, "_id": 1}},
+                    {"$project": {"_id": 0, "value": "$_id", "count": 1}},
+                ]
+                for field in FACET_FIELDS
+            }},
+        ]
+        result = await db.players.aggregate(pipeline).to_list(1)
+        return result[0] if result else {field: [] for field in FACET_FIELDS}
+
+    cache_key = ("facets", json.dumps(filter_dict, sort_keys=True))
+    facets = await player_cache.get_or_load(
+        cache_key, load_facets, weight=lambda value: max(sum(map(len, value.values())), 1)
+    )
+    return negotiated_response(request, facets)
+
+@api_router.get("/players/search", response_model=List[SlimPlayer])
+async def search_players(request: Request, q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50)):
+    """Accent-insensitive prefix and fuzzy search over player names."""
+    if not player_search.ready:
+        try:
+            await asyncio.wait_for(player_search.wait_ready(), SEARCH_READY_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Search index is not ready", headers={"Retry-After": "1"})
+    return negotiated_response(request, player_search.search(q, limit))
 
 @api_router.get("/players/{player_id}", response_model=Player)
 async def get_player(player_id: str):
-    player = await db.players.find_one({"id": player_id})
+    async def load_player():
+        player = await db.players.find_one({"id": player_id})
+        return Player(**player) if player else None
+
+    player = await player_cache.get_or_load(("player", player_id), load_player)
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
-    return Player(**player)
+    return player
+
+SLIM_PLAYER_PROJECTION = {"_id": 0, **{field: 1 for field in SlimPlayer.model_fields}}
+
+async def batch_load_players(player_ids):
+    """Resolve slim players from the catalog cache, then one $in query for the rest."""
+    found = {}
+    missing = []
+    for player_id in player_ids:
+        player = player_cache.peek(("player", player_id))
+        if player is not None:
+            found[player_id] = SlimPlayer(**player.dict())
+        else:
+            missing.append(player_id)
+    if missing:
+        async for doc in db.players.find({"id": {"$in": missing}}, SLIM_PLAYER_PROJECTION):
+            found[doc["id"]] = SlimPlayer(**doc)
+    return found
+
+def player_loader() -> DataLoader:
+    return DataLoader(batch_load_players)
+
+async def expand_formation_players(formations, loader: Optional[DataLoader] = None):
+    loader = loader or player_loader()
+    player_ids = list({fp.player_id for formation in formations for fp in formation.players})
+    players = dict(zip(player_ids, await loader.load_many(player_ids)))
+
+    def expand_slot(slot):
+        player = players.get(slot.player_id)
+        return slot if player is None else {**slot.__dict__, "player": player}
+
+    # Shaped like ExpandedFormation, built from the cached models without copying them
+    return [
+        {**formation.__dict__, "players": [expand_slot(slot) for slot in formation.players]}
+        for formation in formations
+    ]
 
 # Formation routes
 @api_router.post("/formations", response_model=Formation)
 async def create_formation(formation: FormationCreate):
     formation_dict = formation.dict()
-    formation_obj = Formation(**formation_dict)
+    # One batched lookup for the whole line-up, served from the catalog cache when warm
+    player_ids = list(dict.fromkeys(slot.player_id for slot in formation.players))
+    players = await batch_load_players(player_ids)
+    missing = [player_id for player_id in player_ids if player_id not in players]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Players not found: {', '.join(missing)}")
+    aggregates = formation_aggregates(
+        formation.formation_name,
+        formation_dict["players"],
+        {player_id: player.dict() for player_id, player in players.items()},
+    )
+    formation_obj = Formation(**formation_dict, **aggregates)
     await db.formations.insert_one(formation_obj.dict())
+    share_ranking(formation_obj)
+    collection_versions.bump("formations")
+    if vote_buffer:
+        vote_buffer.add_known(formation_obj.id, formation_obj.theme)
+    if not change_stream_source:
+        vote_hub.publish_created(formation_obj.dict())
     return formation_obj
 
-@api_router.get("/formations", response_model=List[Formation])
-async def get_formations(theme: Optional[str] = None):
+@api_router.post("/formations/optimize", response_model=OptimizedFormation)
+async def optimize_formation(request: OptimizeRequest):
+    slots = FORMATION_SLOTS.get(request.formation_name)
+    if slots is None:
+        raise HTTPException(status_code=400, detail=f"Unknown formation: {request.formation_name}")
+    unknown_slots = [slot for slot in request.locked if slot not in slots]
+    if unknown_slots:
+        raise HTTPException(status_code=400, detail=f"Unknown slots: {', '.join(unknown_slots)}")
+
+    try:
+        filter_dict, _ = compile_criteria(request.filter_criteria)
+    except CriteriaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.theme:
+        theme_query = await theme_eligibility.resolve(request.theme, db.themes)
+        if theme_query is None:
+            raise HTTPException(status_code=404, detail="Theme not found")
+        filter_dict = {"$and": [filter_dict, theme_query]} if filter_dict else theme_query
+
+    locked = {}
+    if request.locked:
+        locked_ids = list(request.locked.values())
+        found = {doc["id"]: doc async for doc in db.players.find({"id": {"$in": locked_ids}}, SLIM_PLAYER_PROJECTION)}
+        missing = [player_id for player_id in locked_ids if player_id not in found]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Players not found: {', '.join(missing)}")
+        locked = {slot: found[player_id] for slot, player_id in request.locked.items()}
+
+    open_slots = {slot: role for slot, role in slots.items() if slot not in locked}
+    compatibility = request.compatibility or POSITION_COMPATIBILITY
+    candidates = await load_candidates(
+        db.players,
+        filter_dict,
+        positions_for(open_slots.values(), compatibility),
+        per_position=len(open_slots),
+        projection=SLIM_PLAYER_PROJECTION,
+        exclude_ids=[player["id"] for player in locked.values()],
+    )
+    xi = solve_xi(open_slots, candidates, compatibility)
+
+    players = []
+    for slot in slots:
+        player = locked.get(slot) or xi.get(slot)
+        players.append(OptimizedSlot(position_slot=slot, player=player, locked=slot in locked))
+    total = sum(slot.player.rating for slot in players if slot.player)
+    return OptimizedFormation(formation_name=request.formation_name, total_rating=total, players=players)
+
+@api_router.get("/formations", response_model=List[ExpandedFormation])
+async def get_formations(
+    request: Request,
+    theme: Optional[str] = None,
+    expand: Optional[Literal["players"]] = None,
+    sort: Literal["votes", "total_rating", "avg_rating"] = "votes",
+    country: Optional[str] = None,
+    era: Optional[str] = None,
+    min_avg_rating: Optional[float] = None,
+    include_archived: bool = False,
+):
+    theme = theme or None
     filter_dict = {}
     if theme:
         filter_dict["theme"] = theme
-    
-    formations = await db.formations.find(filter_dict).sort("votes", -1).to_list(100)
-    return [Formation(**formation) for formation in formations]
+    if sort != "votes" or country or era or min_avg_rating is not None:
+        # Quality rankings and filters read the stored aggregates through their indexes
+        if country:
+            filter_dict["countries"] = country
+        if era:
+            filter_dict["eras"] = era
+        if min_avg_rating is not None:
+            filter_dict["avg_rating"] = {"$gte": min_avg_rating}
+        docs = await db.formations.find(filter_dict, FORMATION_PROJECTION).sort(sort, -1).to_list(leaderboard.size)
+        formations = [Formation(**formation) for formation in docs]
+    else:
+        formations = leaderboard.top(theme)
+    if formations is None:
+        # Theme created by another process since startup; seed its board once. Themes without
+        # formations (including any junk ?theme= value) get no board, so boards stay bounded
+        docs = await db.formations.find(filter_dict, FORMATION_PROJECTION).sort("votes", -1).to_list(leaderboard.size)
+        formations = [Formation(**formation) for formation in docs]
+        if formations or theme is None:
+            leaderboard.seed(theme, formations)
+    if include_archived:
+        # The archive is outside the working set; only this explicit flag reads it
+        docs = await db.formations_archive.find(filter_dict, FORMATION_PROJECTION).sort(sort, -1).to_list(leaderboard.size)
+        formations = sorted(
+            [*formations, *(Formation(**formation) for formation in docs)],
+            key=lambda formation: (-getattr(formation, sort), formation.id),
+        )[:leaderboard.size]
+    if expand == "players":
+        return negotiated_response(request, await expand_formation_players(formations))
+    return negotiated_response(request, formations)
+
+# (client, formation) votes awaiting Mongo, so concurrent duplicates are caught before the filter is updated
+votes_in_flight = set()
+
+def reject_duplicate_vote():
+    WRITES_REJECTED.labels("duplicate_vote").inc()
+    raise HTTPException(status_code=409, detail="Already voted for this formation today")
 
 @api_router.put("/formations/{formation_id}/vote")
-async def vote_formation(formation_id: str):
-    result = await db.formations.update_one(
-        {"id": formation_id},
-        {"$inc": {"votes": 1}}
-    )
-    if result.matched_count == 0:
+async def vote_formation(formation_id: str, request: Request):
+    voter = client_key(request.scope, TRUSTED_PROXIES)
+    if vote_buffer:
+        if not await vote_buffer.exists(formation_id):
+            raise HTTPException(status_code=404, detail="Formation not found")
+        # Unknown ids never reach the filter, so a bad id stays a 404
+        if vote_dedup and not vote_dedup.add(voter, formation_id):
+            reject_duplicate_vote()
+        vote_buffer.record(formation_id)
+        if trending:
+            trending.record(formation_id, vote_buffer.theme_of(formation_id))
+        if not change_stream_source:
+            vote_hub.publish_vote(vote_buffer.theme_of(formation_id), formation_id, delta=1)
+        return {"message": "Vote recorded"}
+
+    vote_key = (voter, formation_id)
+    if vote_dedup and (vote_key in votes_in_flight or vote_dedup.seen(voter, formation_id)):
+        reject_duplicate_vote()
+    votes_in_flight.add(vote_key)
+    try:
+        formation = await db.formations.find_one_and_update(
+            {"id": formation_id},
+            {"$inc": {"votes": 1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        if formation is not None and vote_dedup:
+            vote_dedup.add(voter, formation_id)
+    finally:
+        votes_in_flight.discard(vote_key)
+    if formation is None:
         raise HTTPException(status_code=404, detail="Formation not found")
+    share_ranking(Formation(**formation))
+    collection_versions.bump("formations")
+    if trending:
+        trending.record(formation_id, formation.get("theme"))
+    if not change_stream_source:
+        vote_hub.publish_vote(formation.get("theme"), formation_id, delta=1, votes=formation["votes"])
     return {"message": "Vote recorded"}
 
+async def sse_events(subscription):
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            yield b"event: " + message["type"].encode() + b"\ndata: " + dumps(message) + b"\n\n"
+    finally:
+        subscription.close()
+
+@api_router.get("/formations/trending", response_model=List[TrendingFormation])
+async def get_trending_formations(
+    request: Request,
+    window: Literal["1h", "24h", "7d"] = "24h",
+    theme: Optional[str] = None,
+):
+    """Most voted formations in the last `window`, from the latest rollup snapshot."""
+    if not trending:
+        raise HTTPException(status_code=404, detail="Trending rankings are disabled")
+    return negotiated_response(request, trending.top(window, theme or None))
+
+@api_router.get("/formations/stream")
+async def stream_formations(theme: Optional[str] = None):
+    """Server-Sent Events with coalesced vote deltas and new formations for `theme` (all themes if omitted)."""
+    return StreamingResponse(
+        sse_events(vote_hub.subscribe(theme or None)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.websocket("/formations/stream")
+async def stream_formations_ws(websocket: WebSocket, theme: Optional[str] = None):
+    """Same messages as the SSE stream, one JSON text frame each."""
+    await websocket.accept()
+    subscription = vote_hub.subscribe(theme or None)
+
+    async def forward():
+        while True:
+            message = await subscription.get()
+            await websocket.send_text(dumps(message).decode())
+
+    sender = asyncio.get_running_loop().create_task(forward())
+    try:
+        # Nothing is expected from the client; this only waits for the disconnect
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        subscription.close()
+
+@api_router.get("/votes/stats")
+async def get_vote_stats():
+    stats = {"buffered": False}
+    if vote_buffer:
+        stats = {"buffered": True, **vote_buffer.stats()}
+    if vote_dedup:
+        stats["dedup"] = vote_dedup.stats()
+    if trending:
+        stats["trending"] = trending.stats()
+    return stats
+
 # Theme routes
 @api_router.post("/themes", response_model=Theme)
 async def create_theme(theme: ThemeCreate):
     theme_dict = theme.dict()
     theme_obj = Theme(**theme_dict)
+    # Materialized before the insert, so a spec Mongo rejects is a 400 and writes nothing
+    try:
+        eligibility = await theme_eligibility.prepare(theme_obj.filter_criteria)
+    except CriteriaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OperationFailure as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter_criteria: {e}")
     await db.themes.insert_one(theme_obj.dict())
+    # Registered only once stored, so a failed insert leaves no phantom theme behind
+    theme_eligibility.adopt(theme_obj.name, eligibility)
+    collection_versions.bump("themes")
+    # Cached ?theme=<name> pages may hold a previous theme of the same name
+    player_cache.invalidate()
+    if theme_obj.is_daily:
+        daily_theme_resolver.invalidate()
     return theme_obj
 
 @api_router.get("/themes", response_model=List[Theme])
-async def get_themes():
-    themes = await db.themes.find().sort("date", -1).to_list(100)
-    return [Theme(**theme) for theme in themes]
+async def get_themes(request: Request):
+    themes = await db.themes.find({}, THEME_PROJECTION).sort("date", -1).to_list(100)
+    return negotiated_response(request, themes)
+
+# Unused default daily themes are deleted by a TTL index once this many days old
+DAILY_THEME_RETENTION_DAYS = float(os.environ.get('DAILY_THEME_RETENTION_DAYS', 7))
+
+def build_default_daily_theme() -> dict:
+    theme = Theme(
+        name="Leyendas del Fútbol Mundial",
+        description="Arma tu once ideal con las más grandes leyendas de la historia del fútbol",
+        filter_criteria={},
+        is_daily=True
+    ).dict()
+    # The retention job removes expires_at as soon as a formation uses the theme; without
+    # that job nothing would pin used themes, so they must not expire at all
+    if not retention_job:
+        return theme
+    return {**theme, "expires_at": theme["date"] + timedelta(days=DAILY_THEME_RETENTION_DAYS)}
+
+daily_theme_resolver = DailyThemeResolver(
+    db.themes, build_default_daily_theme, on_create=lambda: collection_versions.bump("themes")
+)
 
 @api_router.get("/themes/daily", response_model=Theme)
 async def get_daily_theme():
-    today = datetime.utcnow().date()
-    theme = await db.themes.find_one({
-        "is_daily": True,
-        "date": {
-            "$gte": datetime.combine(today, datetime.min.time()),
-            "$lt": datetime.combine(today, datetime.max.time())
-        }
-    })
-    if not theme:
-        # If no daily theme, create a default one
-        default_theme = Theme(
-            name="Leyendas del Fútbol Mundial",
-            description="Arma tu once ideal con las más grandes leyendas de la historia del fútbol",
-            filter_criteria={},
-            is_daily=True
-        )
-        await db.themes.insert_one(default_theme.dict())
-        return default_theme
+    # Resolved once per UTC day per worker; the default theme is upserted exactly once
+    theme = await daily_theme_resolver.get()
+    if theme_eligibility.query(theme["name"]) is None:
+        theme_eligibility.register(theme["name"], theme.get("filter_criteria"))
     return Theme(**theme)
 
 # Initialize sample data
@@ -356,9 +1063,11 @@ async def init_sample_data():
     ]
     
     # Insert sample players
-    for player_data in sample_players:
-        player = Player(**player_data)
-        await db.players.insert_one(player.dict())
+    await db.players.insert_many([Player(**player_data).dict() for player_data in sample_players])
+    player_cache.invalidate()
+    collection_versions.bump("players")
+    theme_eligibility.invalidate()
+    schedule_search_rebuild()
     
     # Create sample themes
     sample_themes = [
@@ -371,7 +1080,7 @@ async def init_sample_data():
         {
             "name": "Campeones del Mundo",
             "description": "Once ideal con jugadores que han ganado la Copa del Mundo",
-            "filter_criteria": {},
+            "filter_criteria": {"achievements": {"$regex": "World Cup(?! Final)"}},
             "is_daily": False
         },
         {
@@ -382,22 +1091,70 @@ async def init_sample_data():
         }
     ]
     
+    await db.themes.insert_many([Theme(**theme_data).dict() for theme_data in sample_themes])
+    collection_versions.bump("themes")
     for theme_data in sample_themes:
-        theme = Theme(**theme_data)
-        await db.themes.insert_one(theme.dict())
+        theme_eligibility.register(theme_data["name"], theme_data["filter_criteria"])
     
     return {"message": "Sample data created successfully"}
 
+def invalidate_local_caches(collection: str):
+    """Another worker wrote to `collection`; drop everything this worker derived from it."""
+    if collection == "players":
+        player_cache.invalidate()
+        theme_eligibility.invalidate()
+        schedule_search_rebuild()
+    elif collection == "themes":
+        player_cache.invalidate()
+        theme_eligibility.clear()
+        daily_theme_resolver.invalidate()
+    elif collection == "formations":
+        apply_shared_votes()
+    elif collection == "rankings":
+        leaderboard.invalidate()
+
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+# Over-limit writes are rejected before routing; inside CORS so that 429s carry the CORS headers
+if write_limiter:
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=write_limiter,
+        on_reject=lambda: WRITES_REJECTED.labels("rate_limited").inc(),
+        trusted_proxies=TRUSTED_PROXIES,
+    )
+
+# Inside CORS so that 304s carry the CORS headers too
+app.add_middleware(
+    ConditionalGetMiddleware,
+    versions=collection_versions,
+    router=app.router,
+    rules=[
+        (r"/api/players(/facets)?", ("players", "themes")),
+        (r"/api/players/(?!search$|bulk$)[^/]+", ("players",)),
+        (r"/api/themes", ("themes",)),
+        (r"/api/formations", ("formations", "players")),
+    ],
+)
+# Caches must be coherent before the ETag check and the routes read them
+if shared_versions:
+    app.add_middleware(CoherenceMiddleware, versions=collection_versions, on_change=invalidate_local_caches)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
+# Outside the ETag check so that compressed and identity bodies are told apart by the tag's variant
+app.add_middleware(CompressionMiddleware, min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)))
+app.add_middleware(MetricsMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -406,6 +1163,61 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_client():
+    with readiness.phase("mongo_ping"):
+        await client.admin.command("ping")
+    with readiness.phase("indexes"):
+        await reconcile_indexes(db)
+    with readiness.phase("rankings"):
+        await leaderboard.rebuild(db.formations, Formation)
+    with readiness.phase("themes"):
+        await theme_eligibility.load(db.themes)
+    with readiness.phase("formation_aggregates"):
+        await backfill_aggregates(db.formations, db.players)
+    if trending:
+        with readiness.phase("trending"):
+            await trending.load()
+        trending.start()
+    if retention_job:
+        retention_job.start()
+    else:
+        # Themes given a TTL while retention was on would otherwise still expire unpinned
+        await db.themes.update_many({"expires_at": {"$exists": True}}, {"$unset": {"expires_at": ""}})
+    # The search index builds in the background; /players/search waits for it
+    schedule_search_rebuild()
+    vote_hub.start()
+    if change_stream_source:
+        change_stream_source.start()
+    if vote_buffer:
+        with readiness.phase("vote_buffer"):
+            await vote_buffer.load_known_ids()
+        vote_buffer.start()
+    # Test mode: refuse to start if any route query would scan a whole collection
+    if os.environ.get('INDEX_EXPLAIN_CHECK', '').lower() in ('1', 'true', 'yes'):
+        with readiness.phase("explain_check"):
+            await assert_no_collscan(db)
+    with readiness.phase("warm_up"):
+        await warm_up(app, WARM_UP_PATHS)
+    readiness.mark_ready()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Pending votes must reach Mongo before the connection goes away
+    if vote_buffer:
+        await vote_buffer.stop()
+    if trending:
+        await trending.stop()
+    if retention_job:
+        await retention_job.stop()
+    if change_stream_source:
+        await change_stream_source.stop()
+    await vote_hub.stop()
     client.close()
+    if shared_versions:
+        shared_versions.close()
+    if vote_log:
+        vote_log.close()
+    if isinstance(vote_dedup, SharedDailyBloomFilter):
+        vote_dedup.close()
+    mark_worker_exited()
@@ -0,0 +1,237 @@
+"""Trending formation rankings over sliding time windows.
+
+Each vote increments an in-memory counter for its formation and current time
+bucket (`bucket_minutes` wide). Every `flush_interval` seconds the counters go
+to the `vote_buckets` collection as one unordered bulk of `$inc` upserts, the
+same write-behind approach as `VoteBuffer`.
+
+Every `rollup_interval` seconds one worker takes a lease in the `jobs`
+collection and runs the rollup:
+
+- It sums the buckets of each window (`1h`, `24h`, `7d`) per formation.
+- It stores the top `size` formations per theme, plus an overall list, as
+  snapshot documents in `trending`.
+
+Every worker then loads the snapshots into memory, so reads never touch the
+buckets.
+
+Buckets stay compact. Fine buckets from UTC days that ended more than 24 hours
+ago are folded into one daily bucket per formation. A TTL index deletes every
+bucket `retention` after it starts. The `1h` and `24h` windows are exact to
+one fine bucket, and the `7d` window is exact to one day.
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import PyMongoError
+
+from leases import acquire_lease, new_owner
+
+logger = logging.getLogger(__name__)
+
+WINDOWS: Dict[str, timedelta] = {
+    "1h": timedelta(hours=1),
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+}
+FINE = "fine"
+DAILY = "daily"
+LEASE_ID = "trending_rollup"
+
+
+def _day(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, moment.day)
+
+
+class TrendingRankings:
+    def __init__(self, buckets, snapshots, jobs, formations, projection: Optional[dict] = None, size: int = 100,
+                 bucket_minutes: int = 5, flush_interval: float = 1.0, rollup_interval: float = 60.0,
+                 retention: timedelta = timedelta(days=8)):
+        self.buckets = buckets
+        self.snapshots = snapshots
+        self.jobs = jobs
+        self.formations = formations
+        self.projection = projection or {"_id": 0}
+        self.size = size
+        self.bucket_minutes = bucket_minutes
+        self.flush_interval = flush_interval
+        self.rollup_interval = rollup_interval
+        self.retention = retention
+        self.owner = new_owner()
+        self._pending: Counter = Counter()  # (formation id, theme, bucket) -> votes
+        self._top: Dict[Tuple[str, Optional[str]], list] = {}
+        self._tasks = []
+        self.last_rollup_at: Optional[datetime] = None
+
+    def _bucket(self, moment: datetime) -> datetime:
+        minute = moment.minute - moment.minute % self.bucket_minutes
+        return moment.replace(minute=minute, second=0, microsecond=0)
+
+    def record(self, formation_id: str, theme: Optional[str], delta: int = 1):
+        self._pending[(formation_id, theme, self._bucket(datetime.utcnow()))] += delta
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, Counter()
+        operations = [
+            UpdateOne(
+                {"formation_id": formation_id, "granularity": FINE, "bucket": bucket},
+                {"$inc": {"count": count},
+                 "$setOnInsert": {"theme": theme, "expires_at": bucket + self.retention}},
+                upsert=True,
+            )
+            for (formation_id, theme, bucket), count in pending.items()
+        ]
+        try:
+            await self.buckets.bulk_write(operations, ordered=False)
+        except PyMongoError:
+            # Keep the counts for the next flush rather than lose the batch
+            logger.exception("Trending bucket flush failed, requeueing %d buckets", len(operations))
+            self._pending.update(pending)
+            return 0
+        return sum(pending.values())
+
+    async def _window_totals(self, since: datetime):
+        """The top formations since `since`, per theme and overall."""
+        match_group = [
+            {"$match": {"bucket": {"$gte": since}}},
+            {"$group": {"_id": "$formation_id", "theme": {"$first": "$theme"}, "votes": {"$sum": "$count"}}},
+        ]
+        per_theme = {}
+        # $topN keeps only `size` entries per theme while grouping (MongoDB 5.2+), so no
+        # theme's array can approach the 16 MB document limit
+        async for doc in self.buckets.aggregate(match_group + [
+            {"$group": {"_id": "$theme", "top": {"$topN": {
+                "n": self.size,
+                "sortBy": {"votes": -1, "_id": 1},
+                "output": {"id": "$_id", "votes": "$votes"},
+            }}}},
+        ], allowDiskUse=True):
+            per_theme[doc["_id"]] = doc["top"]
+        overall = [
+            {"id": doc["_id"], "votes": doc["votes"]}
+            async for doc in self.buckets.aggregate(
+                match_group + [{"$sort": {"votes": -1, "_id": 1}}, {"$limit": self.size}], allowDiskUse=True
+            )
+        ]
+        return per_theme, overall
+
+    async def rollup(self, now: Optional[datetime] = None):
+        """Recompute the top formations of every window and store them as snapshots."""
+        now = now or datetime.utcnow()
+        rankings = {}
+        for window, span in WINDOWS.items():
+            per_theme, overall = await self._window_totals(now - span)
+            rankings[(window, None)] = overall
+            for theme, top in per_theme.items():
+                if theme is not None:
+                    rankings[(window, theme)] = top
+
+        ids = list({entry["id"] for top in rankings.values() for entry in top})
+        formations = {}
+        if ids:
+            async for doc in self.formations.find({"id": {"$in": ids}}, self.projection):
+                formations[doc["id"]] = doc
+
+        operations = []
+        snapshot_ids = []
+        for (window, theme), top in rankings.items():
+            entries = [
+                {**formations[entry["id"]], "window_votes": entry["votes"]}
+                for entry in top if entry["id"] in formations
+            ]
+            snapshot_id = f"{window}:{theme or ''}"
+            snapshot_ids.append(snapshot_id)
+            operations.append(ReplaceOne(
+                {"_id": snapshot_id},
+                {"_id": snapshot_id, "window": window, "theme": theme, "computed_at": now, "formations": entries},
+                upsert=True,
+            ))
+        if operations:
+            await self.snapshots.bulk_write(operations, ordered=False)
+        # Themes without votes in a window drop out of it
+        await self.snapshots.delete_many({"_id": {"$nin": snapshot_ids}})
+        self.last_rollup_at = now
+
+    async def compact(self, now: Optional[datetime] = None) -> int:
+        """Fold fine buckets of days that ended before the 24h window into daily buckets."""
+        now = now or datetime.utcnow()
+        cutoff = _day(now - WINDOWS["24h"])
+        old = {"granularity": FINE, "bucket": {"$lt": cutoff}}
+        operations = []
+        async for doc in self.buckets.aggregate([
+            {"$match": old},
+            {"$group": {
+                "_id": {"formation_id": "$formation_id", "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$bucket"}}},
+                "theme": {"$first": "$theme"},
+                "count": {"$sum": "$count"},
+            }},
+        ], allowDiskUse=True):
+            day = datetime.strptime(doc["_id"]["day"], "%Y-%m-%d")
+            operations.append(UpdateOne(
+                {"formation_id": doc["_id"]["formation_id"], "granularity": DAILY, "bucket": day},
+                {"$inc": {"count": doc["count"]},
+                 "$setOnInsert": {"theme": doc["theme"], "expires_at": day + self.retention}},
+                upsert=True,
+            ))
+        if not operations:
+            return 0
+        await self.buckets.bulk_write(operations, ordered=False)
+        # Nothing writes to buckets this old any more, so the delete cannot race a vote
+        result = await self.buckets.delete_many(old)
+        logger.info("Compacted %d trending buckets into %d daily buckets", result.deleted_count, len(operations))
+        return result.deleted_count
+
+    async def load(self):
+        """Replace the in-memory rankings with the stored snapshots."""
+        top = {}
+        async for doc in self.snapshots.find({}, {"window": 1, "theme": 1, "formations": 1}):
+            top[(doc["window"], doc["theme"])] = doc["formations"]
+        self._top = top
+
+    def top(self, window: str, theme: Optional[str] = None) -> list:
+        return self._top.get((window, theme), [])
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _rollup_loop(self):
+        while True:
+            try:
+                # Only the lease holder rolls up and compacts; the lease outlives two intervals
+                if await acquire_lease(self.jobs, LEASE_ID, self.owner, timedelta(seconds=2 * self.rollup_interval)):
+                    await self.compact()
+                    await self.rollup()
+                await self.load()
+            except PyMongoError:
+                logger.exception("Trending rollup failed")
+            await asyncio.sleep(self.rollup_interval)
+
+    def start(self):
+        if not self._tasks:
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._flush_loop()), loop.create_task(self._rollup_loop())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_buckets": len(self._pending),
+            "rankings": len(self._top),
+            "last_rollup_at": self.last_rollup_at.isoformat() if self.last_rollup_at else None,
+        }
@@ -0,0 +1,136 @@
+"""Write-behind aggregation of formation votes.
+
+Instead of one `$inc` per click, votes are summed in memory per formation id
+and written as a single unordered `bulk_write` every `flush_interval` seconds,
+or sooner once `max_pending` votes have piled up.
+"""
+import asyncio
+import logging
+import sys
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer:
+    def __init__(self, collection, flush_interval: float = 1.0, max_pending: int = 1000, on_flush=None):
+        self.collection = collection
+        self.on_flush = on_flush
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Counter = Counter()
+        self._pending_total = 0
+        self._oldest_pending_at: Optional[float] = None
+        self._known: Dict[str, Optional[str]] = {}  # formation id -> theme
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.last_flush_at: Optional[float] = None
+        self.last_flush_duration = 0.0
+        self.flushed_votes = 0
+
+    # Known formations and their themes, used to answer 404s without touching Mongo
+    async def load_known_ids(self):
+        async for doc in self.collection.find({}, {"id": 1, "theme": 1, "_id": 0}):
+            self.add_known(doc["id"], doc.get("theme"))
+
+    def add_known(self, formation_id: str, theme: Optional[str] = None):
+        # Themes repeat across many formations; share one string per theme
+        self._known[formation_id] = sys.intern(theme) if theme else None
+
+    def forget(self, formation_id: str):
+        self._known.pop(formation_id, None)
+
+    def theme_of(self, formation_id: str) -> Optional[str]:
+        return self._known.get(formation_id)
+
+    async def exists(self, formation_id: str) -> bool:
+        if formation_id in self._known:
+            return True
+        # Created by another worker since startup
+        doc = await self.collection.find_one({"id": formation_id}, {"theme": 1, "_id": 0})
+        if doc is not None:
+            self.add_known(formation_id, doc.get("theme"))
+            return True
+        return False
+
+    def record(self, formation_id: str, delta: int = 1):
+        if self._oldest_pending_at is None:
+            self._oldest_pending_at = time.monotonic()
+        self._pending[formation_id] += delta
+        self._pending_total += delta
+        if self._pending_total >= self.max_pending and not self._lock.locked():
+            asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> int:
+        async with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, Counter()
+            self._pending_total = 0
+            self._oldest_pending_at = None
+
+            ids = list(pending)
+            failed = []
+            operations = [UpdateOne({"id": fid}, {"$inc": {"votes": pending[fid]}}) for fid in ids]
+            started = time.monotonic()
+            try:
+                await self.collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                failed = [ids[error["index"]] for error in e.details.get("writeErrors", [])]
+                logger.error("Vote flush failed for %d formations, requeueing", len(failed))
+                self._requeue({fid: pending[fid] for fid in failed})
+            except PyMongoError:
+                logger.exception("Vote flush failed, requeueing %d formations", len(ids))
+                self._requeue(pending)
+                return 0
+            self.last_flush_at = time.time()
+            self.last_flush_duration = time.monotonic() - started
+            for formation_id in failed:
+                del pending[formation_id]
+            flushed = sum(pending.values())
+            self.flushed_votes += flushed
+
+        if self.on_flush and pending:
+            try:
+                await self.on_flush(list(pending))
+            except PyMongoError:
+                logger.exception("Vote flush callback failed")
+        return flushed
+
+    def _requeue(self, deltas):
+        for formation_id, delta in deltas.items():
+            self.record(formation_id, delta)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        lag = time.monotonic() - self._oldest_pending_at if self._oldest_pending_at else 0.0
+        return {
+            "pending_votes": self._pending_total,
+            "pending_formations": len(self._pending),
+            "flush_lag_seconds": round(lag, 3),
+            "last_flush_duration_seconds": round(self.last_flush_duration, 3),
+            "flushed_votes": self.flushed_votes,
+        }
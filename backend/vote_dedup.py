@@ -0,0 +1,171 @@
+"""One vote per client and formation per UTC day, checked in memory.
+
+`DailyBloomFilter` is a Bloom filter sized for `capacity` keys at
+`error_rate` false positives, replaced by an empty one when the UTC day
+changes. Membership is approximate in one direction only. A key that was
+added is always reported as seen. A new key is wrongly reported as seen with
+probability about `error_rate`, so an honest vote is rejected about once per
+1000 at the default error rate, while the filter stays within its capacity.
+Memory is fixed at about 1.8 MB per million keys at 0.1%.
+
+With several workers, `SharedDailyBloomFilter` keeps the filter in a file
+that every worker maps, by default in /dev/shm, so a vote is deduplicated
+whichever worker receives it. A header holds the day and the number of keys.
+Adds check and set the bits under an exclusive `flock`, and lookups read the
+map without locking, like `coherence.SharedCounters`.
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Optional
+
+SECONDS_PER_DAY = 86400
+HEADER = struct.Struct("<QQ")  # day, keys added that day
+
+
+def _today() -> int:
+    return int(time.time() // SECONDS_PER_DAY)
+
+
+def _key(client: str, formation_id: str) -> str:
+    return f"{client}\x00{formation_id}"
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float, bits=None):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray(self.byte_size) if bits is None else bits
+        self.count = 0
+
+    @property
+    def byte_size(self) -> int:
+        return (self.size + 7) // 8
+
+    def _positions(self, key: str):
+        # Double hashing: h1 + i * h2 over one 128-bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str) -> bool:
+        """Add `key`; returns False if it was (probably) already present."""
+        positions = self._positions(key)
+        bits = self._bits
+        if all(bits[p >> 3] & (1 << (p & 7)) for p in positions):
+            return False
+        for p in positions:
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+        return True
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._bits)
+
+
+class DailyBloomFilter:
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._day: Optional[int] = None
+        self._filter: Optional[BloomFilter] = None
+
+    def _current(self) -> BloomFilter:
+        day = _today()
+        if day != self._day:
+            self._day = day
+            self._filter = BloomFilter(self.capacity, self.error_rate)
+        return self._filter
+
+    def seen(self, client: str, formation_id: str) -> bool:
+        return _key(client, formation_id) in self._current()
+
+    def add(self, client: str, formation_id: str) -> bool:
+        """Record a vote; False when this client already voted for the formation today."""
+        return self._current().add(_key(client, formation_id))
+
+    def stats(self) -> dict:
+        current = self._current()
+        return {
+            "votes_today": current.count,
+            "capacity": current.capacity,
+            "fill_ratio": round(current.count / current.capacity, 4),
+            "memory_bytes": current.memory_bytes,
+        }
+
+
+def default_dedup_path() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "dream11-vote-dedup")
+
+
+class SharedDailyBloomFilter:
+    def __init__(self, path: str, capacity: int = 1_000_000, error_rate: float = 0.001):
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter = BloomFilter(capacity, error_rate, bits=b"")
+        size = HEADER.size + self._filter.byte_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # A file sized for other settings cannot be reused; start it over empty
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+        self._filter._bits = memoryview(self._map)[HEADER.size:]
+
+    def _header(self):
+        return HEADER.unpack_from(self._map, 0)
+
+    def seen(self, client: str, formation_id: str) -> bool:
+        day, _ = self._header()
+        return day == _today() and _key(client, formation_id) in self._filter
+
+    def add(self, client: str, formation_id: str) -> bool:
+        """Record a vote; False when this client already voted for the formation today."""
+        key = _key(client, formation_id)
+        today = _today()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            day, count = self._header()
+            if day != today:
+                # First add of a new UTC day, in whichever worker: start from an empty filter
+                self._filter._bits[:] = bytes(self._filter.byte_size)
+                count = 0
+            added = self._filter.add(key)
+            HEADER.pack_into(self._map, 0, today, count + added)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return added
+
+    def stats(self) -> dict:
+        day, count = self._header()
+        count = count if day == _today() else 0
+        return {
+            "votes_today": count,
+            "capacity": self.capacity,
+            "fill_ratio": round(count / self.capacity, 4),
+            "memory_bytes": self._filter.memory_bytes,
+        }
+
+    def close(self):
+        # The view must go before the map can close
+        self._filter._bits.release()
+        self._map.close()
+        os.close(self._fd)
@@ -0,0 +1,190 @@
+"""Live formation updates for the rankings view.
+
+`VoteHub` is an in-process pub/sub keyed by theme. The vote and create routes
+publish to it. Vote deltas are coalesced per formation and pushed to
+subscribers every `interval` seconds as a single message:
+
+    {"type": "votes", "deltas": {"<id>": 3}, "votes": {"<id>": 120}}
+
+`deltas` holds the increments since the previous message. `votes` holds the
+absolute counts when the publisher knew them, and clients should prefer them
+over the deltas. New formations are pushed right away as
+`{"type": "created", "formation": {...}}`. A subscriber that falls too far
+behind gets its queue replaced with `{"type": "resync"}` and should re-fetch
+the rankings.
+
+Subscribers to theme `None` receive updates for every theme.
+
+With several workers, `ChangeStreamSource` feeds the hub from a MongoDB change
+stream on the formations collection instead, so every worker sees every
+write. That requires a replica set.
+"""
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+RESYNC = {"type": "resync"}
+
+
+class Subscription:
+    def __init__(self, hub: "VoteHub", theme: Optional[str], max_queue: int):
+        self.hub = hub
+        self.theme = theme
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+
+    def put(self, message: dict):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too slow to keep up; drop the backlog and ask the client to reload
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class VoteHub:
+    def __init__(self, interval: float = 0.25, max_queue: int = 100):
+        self.interval = interval
+        self.max_queue = max_queue
+        self._subscribers: Dict[Optional[str], Set[Subscription]] = defaultdict(set)
+        self._deltas: Dict[Optional[str], Counter] = defaultdict(Counter)
+        self._votes: Dict[Optional[str], Dict[str, int]] = defaultdict(dict)
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, theme: Optional[str] = None) -> Subscription:
+        subscription = Subscription(self, theme, self.max_queue)
+        self._subscribers[theme].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.theme)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.theme]
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _listening(self, theme: Optional[str]) -> bool:
+        return bool(self._subscribers.get(theme) or self._subscribers.get(None))
+
+    def publish_vote(self, theme: Optional[str], formation_id: str, delta: int = 0, votes: Optional[int] = None):
+        if not self._listening(theme):
+            return
+        if delta:
+            self._deltas[theme][formation_id] += delta
+        if votes is not None:
+            # Votes only grow; a late, older count must not win
+            known = self._votes[theme]
+            known[formation_id] = max(votes, known.get(formation_id, 0))
+
+    def publish_created(self, formation: dict):
+        message = {"type": "created", "formation": formation}
+        for theme in {formation.get("theme"), None}:
+            for subscription in list(self._subscribers.get(theme, ())):
+                subscription.put(message)
+
+    def flush(self):
+        """Send the coalesced deltas of every theme to its subscribers and to the catch-all ones."""
+        themes = set(self._deltas) | set(self._votes)
+        if not themes:
+            return
+        deltas, self._deltas = self._deltas, defaultdict(Counter)
+        votes, self._votes = self._votes, defaultdict(dict)
+
+        everything = {"type": "votes", "deltas": Counter(), "votes": {}}
+        for theme in themes:
+            message = {"type": "votes", "deltas": dict(deltas.get(theme, {})), "votes": votes.get(theme, {})}
+            for subscription in list(self._subscribers.get(theme, ())):
+                subscription.put(message)
+            everything["deltas"].update(message["deltas"])
+            everything["votes"].update(message["votes"])
+        if self._subscribers.get(None):
+            everything["deltas"] = dict(everything["deltas"])
+            for subscription in list(self._subscribers[None]):
+                subscription.put(everything)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush()
+
+
+class ChangeStreamSource:
+    """Publishes formation inserts and vote updates seen by a change stream on `collection`."""
+
+    def __init__(self, collection, hub: VoteHub, retry_delay: float = 5.0):
+        self.collection = collection
+        self.hub = hub
+        self.retry_delay = retry_delay
+        self._task: Optional[asyncio.Task] = None
+        self._resume_token = None
+
+    async def _watch(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update"]}}}]
+        async with self.collection.watch(
+            pipeline, full_document="updateLookup", resume_after=self._resume_token
+        ) as stream:
+            async for change in stream:
+                self._resume_token = stream.resume_token
+                document = change.get("fullDocument")
+                if document is None:
+                    continue
+                document.pop("_id", None)
+                if change["operationType"] == "insert":
+                    self.hub.publish_created(document)
+                elif "votes" in change.get("updateDescription", {}).get("updatedFields", {}):
+                    self.hub.publish_vote(document.get("theme"), document["id"], votes=document["votes"])
+
+    async def _run(self):
+        while True:
+            try:
+                await self._watch()
+            except OperationFailure as e:
+                if e.code == 40573:  # change streams need a replica set
+                    logger.error("Formation change stream unavailable: %s", e)
+                    return
+                logger.exception("Formation change stream failed, retrying")
+            except PyMongoError:
+                logger.exception("Formation change stream failed, retrying")
+            await asyncio.sleep(self.retry_delay)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -179,6 +179,15 @@ class FootballTeamBuilderAPITest(unittest.TestCase):
         self.assertGreaterEqual(len(themes), 1)
         print(f"✅ Retrieved {len(themes)} themes")
         
+        # Criteria Mongo would reject are a 400 and store nothing
+        invalid_theme = {**self.theme_data, "name": f"Invalid Theme {time.time()}",
+                         "filter_criteria": {"achievements": {"$any": []}}}
+        response = requests.post(f"{API_URL}/themes", json=invalid_theme)
+        self.assertEqual(response.status_code, 400)
+        names = [theme["name"] for theme in requests.get(f"{API_URL}/themes").json()]
+        self.assertNotIn(invalid_theme["name"], names)
+        print("✅ Invalid criteria rejected without storing the theme")
+        
         # Get daily theme
         response = requests.get(f"{API_URL}/themes/daily")
         self.assertEqual(response.status_code, 200)
@@ -263,6 +272,344 @@ class FootballTeamBuilderAPITest(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
         print("✅ Correctly handled voting for non-existent formation")
 
+    def test_05_player_pagination(self):
+        """Test keyset pagination and NDJSON streaming for players"""
+        print("\n=== Testing Player Pagination ===")
+        
+        response = requests.get(f"{API_URL}/players")
+        self.assertEqual(response.status_code, 200)
+        all_ids = [p["id"] for p in response.json()]
+        
+        # Walk the catalog two players at a time
+        paged_ids = []
+        cursor = None
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = requests.get(f"{API_URL}/players", params=params)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page), 2)
+            paged_ids.extend(p["id"] for p in page)
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        self.assertEqual(sorted(paged_ids), sorted(all_ids))
+        self.assertEqual(len(paged_ids), len(set(paged_ids)))
+        print(f"✅ Paged through {len(paged_ids)} players")
+        
+        # Invalid cursors are rejected
+        response = requests.get(f"{API_URL}/players", params={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+        print("✅ Correctly rejected an invalid cursor")
+        
+        # NDJSON streaming returns one document per line
+        response = requests.get(f"{API_URL}/players", headers={"Accept": "application/x-ndjson"}, stream=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+        streamed = [json.loads(line) for line in response.iter_lines() if line]
+        self.assertEqual(len(streamed), len(all_ids))
+        self.assertTrue(all("_id" not in p for p in streamed))
+        print(f"✅ Streamed {len(streamed)} players as NDJSON")
+
+    def test_06_bulk_player_ingestion(self):
+        """Test bulk NDJSON/CSV player loading"""
+        print("\n=== Testing Bulk Player Ingestion ===")
+        
+        good = dict(self.player_data, name="Bulk Player One")
+        bad = dict(self.player_data, name="Bulk Player Two", rating="not-a-number")
+        body = "\n".join([json.dumps(good), "{not json", json.dumps(bad)])
+        response = requests.post(f"{API_URL}/players/bulk", data=body.encode(),
+                                 headers={"Content-Type": "application/x-ndjson"})
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result["received"], 3)
+        self.assertEqual(result["inserted"], 1)
+        self.assertEqual(result["error_count"], 2)
+        self.assertEqual([e["row"] for e in result["errors"]], [2, 3])
+        print(f"✅ Bulk NDJSON load: {result['inserted']} inserted, {result['error_count']} errors")
+        
+        # Upserting the same natural key updates instead of duplicating
+        csv_body = (
+            "name,position,club,country,rating,image_url,achievements,era\n"
+            f"Bulk Player One,CM,Test FC,{self.player_data['country']},70,https://example.com/x.jpg,Cup A|Cup B,2020s\n"
+        )
+        response = requests.post(f"{API_URL}/players/bulk?mode=upsert", data=csv_body.encode(),
+                                 headers={"Content-Type": "text/csv"})
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result["inserted"], 0)
+        self.assertEqual(result["updated"], 1)
+        print("✅ Bulk CSV upsert updated the existing player")
+
+    def test_07_expanded_formations(self):
+        """Test inlining player data into formations"""
+        print("\n=== Testing Formation Player Expansion ===")
+        
+        response = requests.get(f"{API_URL}/formations?expand=players")
+        self.assertEqual(response.status_code, 200)
+        formations = response.json()
+        for formation in formations:
+            for slot in formation["players"]:
+                if "player" in slot:
+                    self.assertEqual(slot["player"]["id"], slot["player_id"])
+                    self.assertNotIn("description", slot["player"])
+        print(f"✅ Expanded players for {len(formations)} formations")
+        
+        # Without expand the formation shape is unchanged
+        response = requests.get(f"{API_URL}/formations")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all("player" not in slot for f in response.json() for slot in f["players"]))
+        print("✅ Formations are not expanded by default")
+
+    def test_08_player_search(self):
+        """Test accent-insensitive typeahead search"""
+        print("\n=== Testing Player Search ===")
+        
+        for query, expected in (("modric", "Luka Modrić"), ("nazario", "Ronaldo Nazário"), ("mess", "Lionel Messi")):
+            response = requests.get(f"{API_URL}/players/search", params={"q": query})
+            self.assertEqual(response.status_code, 200)
+            names = [player["name"] for player in response.json()]
+            self.assertIn(expected, names)
+            print(f"✅ '{query}' found {expected}")
+        
+        response = requests.get(f"{API_URL}/players/search", params={"q": "zzzzzz"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        print("✅ Unknown names return no results")
+
+    def test_09_player_facets(self):
+        """Test facet counts for the filter dropdowns"""
+        print("\n=== Testing Player Facets ===")
+        
+        response = requests.get(f"{API_URL}/players/facets")
+        self.assertEqual(response.status_code, 200)
+        facets = response.json()
+        for field in ("position", "club", "country", "era"):
+            self.assertIn(field, facets)
+        clubs = {facet["value"]: facet["count"] for facet in facets["club"]}
+        self.assertGreaterEqual(clubs.get("Barcelona", 0), 1)
+        print(f"✅ Got facets for {len(clubs)} clubs")
+        
+        # Scoped by a filter, every position count matches the filtered players
+        response = requests.get(f"{API_URL}/players/facets", params={"club": "Barcelona"})
+        self.assertEqual(response.status_code, 200)
+        scoped = response.json()
+        self.assertEqual([facet["value"] for facet in scoped["club"]], ["Barcelona"])
+        self.assertEqual(sum(facet["count"] for facet in scoped["position"]), scoped["club"][0]["count"])
+        print("✅ Facets are scoped by the current filters")
+
+    def test_10_conditional_get(self):
+        """Test ETags and 304 responses"""
+        print("\n=== Testing Conditional GET ===")
+        
+        response = requests.get(f"{API_URL}/themes")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers.get("ETag")
+        self.assertIsNotNone(etag)
+        self.assertEqual(response.headers.get("Cache-Control"), "no-cache")
+        
+        response = requests.get(f"{API_URL}/themes", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        print("✅ Unchanged themes return 304")
+        
+        # A write bumps the version, so the old tag no longer matches
+        theme = {"name": f"ETag Theme {time.time()}", "description": "Test theme", "filter_criteria": {}, "is_daily": False}
+        self.assertEqual(requests.post(f"{API_URL}/themes", json=theme).status_code, 200)
+        response = requests.get(f"{API_URL}/themes", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers.get("ETag"), etag)
+        print("✅ Writes change the ETag")
+
+    def test_11_wire_formats(self):
+        """Test columnar layout, MessagePack negotiation and compression"""
+        print("\n=== Testing Wire Formats ===")
+        
+        players = requests.get(f"{API_URL}/players").json()
+        response = requests.get(f"{API_URL}/players", headers={"Accept": "application/vnd.columnar+json"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["Content-Type"].startswith("application/vnd.columnar+json"))
+        table = response.json()
+        ids = table["columns"][table["fields"].index("id")]
+        self.assertEqual(ids, [player["id"] for player in players])
+        print(f"✅ Columnar layout for {len(ids)} players")
+        
+        response = requests.get(f"{API_URL}/players", headers={"Accept": "application/msgpack"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Type"], "application/msgpack")
+        print(f"✅ MessagePack response of {len(response.content)} bytes")
+        
+        response = requests.get(f"{API_URL}/players", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers.get("Content-Encoding"), "gzip")
+        self.assertEqual(response.json(), players)
+        print("✅ Large responses are gzip-compressed")
+
+    def test_12_vote_stream(self):
+        """Test live vote deltas over Server-Sent Events"""
+        print("\n=== Testing Vote Stream ===")
+        
+        # A fresh formation, so that the vote is not a duplicate of an earlier run
+        formation = {"user_name": "Stream Tester", "formation_name": "4-3-3", "theme": "Stream Theme", "players": []}
+        response = requests.post(f"{API_URL}/formations", json=formation)
+        self.assertEqual(response.status_code, 200)
+        formation_id = response.json()["id"]
+        
+        with requests.get(f"{API_URL}/formations/stream", stream=True, timeout=10) as stream:
+            self.assertEqual(stream.status_code, 200)
+            self.assertTrue(stream.headers["Content-Type"].startswith("text/event-stream"))
+            self.assertEqual(requests.put(f"{API_URL}/formations/{formation_id}/vote").status_code, 200)
+            
+            event = None
+            for line in stream.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: ") and event == "votes":
+                    message = json.loads(line[len("data: "):])
+                    if formation_id in message["deltas"]:
+                        break
+            self.assertEqual(event, "votes")
+            self.assertGreaterEqual(message["deltas"][formation_id], 1)
+        print("✅ Vote delta received over SSE")
+
+    def test_13_vote_dedup(self):
+        """Test that a client can vote only once per formation and day"""
+        print("\n=== Testing Vote Deduplication ===")
+        
+        formation = {"user_name": "Dedup Tester", "formation_name": "4-3-3", "theme": "Dedup Theme", "players": []}
+        response = requests.post(f"{API_URL}/formations", json=formation)
+        self.assertEqual(response.status_code, 200)
+        formation_id = response.json()["id"]
+        
+        response = requests.put(f"{API_URL}/formations/{formation_id}/vote")
+        self.assertEqual(response.status_code, 200)
+        response = requests.put(f"{API_URL}/formations/{formation_id}/vote")
+        self.assertEqual(response.status_code, 409)
+        print("✅ Second vote from the same client rejected")
+        
+        stats = requests.get(f"{API_URL}/votes/stats").json()
+        self.assertGreaterEqual(stats["dedup"]["votes_today"], 1)
+        print(f"✅ Dedup filter holds {stats['dedup']['votes_today']} votes today")
+
+    def test_14_health_and_readiness(self):
+        """Test the liveness and readiness probes"""
+        print("\n=== Testing Health and Readiness ===")
+        
+        response = requests.get(f"{API_URL}/healthz")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "ok")
+        print("✅ Liveness probe answers")
+        
+        response = requests.get(f"{API_URL}/readyz")
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual(report["status"], "ready")
+        for phase in ("mongo_ping", "indexes", "rankings", "themes", "warm_up", "total"):
+            self.assertIn(phase, report["phases"])
+        print(f"✅ Ready after {report['phases']['total']}s")
+
+    def test_15_formation_aggregates(self):
+        """Test player validation and quality aggregates on formations"""
+        print("\n=== Testing Formation Aggregates ===")
+        
+        formation = {"user_name": "Aggregate Tester", "formation_name": "4-3-3", "theme": "Aggregate Theme",
+                     "players": [{"player_id": "nonexistent-id", "position_slot": "ST"}]}
+        response = requests.post(f"{API_URL}/formations", json=formation)
+        self.assertEqual(response.status_code, 404)
+        print("✅ Unknown player ids rejected")
+        
+        response = requests.post(f"{API_URL}/players", json=self.player_data)
+        self.assertEqual(response.status_code, 200)
+        player = response.json()
+        self.created_resources["players"].append(player["id"])
+        formation["players"] = [{"player_id": player["id"], "position_slot": "ST"}]
+        response = requests.post(f"{API_URL}/formations", json=formation)
+        self.assertEqual(response.status_code, 200)
+        created = response.json()
+        self.assertEqual(created["total_rating"], self.player_data["rating"])
+        self.assertEqual(created["line_ratings"], {"attack": self.player_data["rating"]})
+        self.assertEqual(created["countries"], [self.player_data["country"]])
+        print(f"✅ Stored total rating {created['total_rating']}")
+        
+        response = requests.get(f"{API_URL}/formations", params={"sort": "total_rating", "country": self.player_data["country"]})
+        self.assertEqual(response.status_code, 200)
+        ranked = response.json()
+        self.assertIn(created["id"], [f["id"] for f in ranked])
+        ratings = [f["total_rating"] for f in ranked]
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+        print(f"✅ {len(ranked)} formations ranked by total rating")
+
+    def test_16_trending_formations(self):
+        """Test trending rankings over time windows"""
+        print("\n=== Testing Trending Formations ===")
+        
+        for window in ("1h", "24h", "7d"):
+            response = requests.get(f"{API_URL}/formations/trending", params={"window": window})
+            self.assertEqual(response.status_code, 200)
+            trending = response.json()
+            window_votes = [f["window_votes"] for f in trending]
+            self.assertEqual(window_votes, sorted(window_votes, reverse=True))
+            print(f"✅ {len(trending)} trending formations in the last {window}")
+        
+        response = requests.get(f"{API_URL}/formations/trending", params={"window": "1y"})
+        self.assertEqual(response.status_code, 422)
+        print("✅ Unknown window rejected")
+        
+        stats = requests.get(f"{API_URL}/votes/stats").json()
+        self.assertIn("trending", stats)
+        print(f"✅ Trending stats: {stats['trending']}")
+
+    def test_17_include_archived(self):
+        """Test reading archived formations alongside the live ones"""
+        print("\n=== Testing Archived Formations ===")
+        
+        live = requests.get(f"{API_URL}/formations").json()
+        response = requests.get(f"{API_URL}/formations", params={"include_archived": "true"})
+        self.assertEqual(response.status_code, 200)
+        everything = response.json()
+        self.assertGreaterEqual(len(everything), min(len(live), 100))
+        votes = [f["votes"] for f in everything]
+        self.assertEqual(votes, sorted(votes, reverse=True))
+        print(f"✅ {len(everything)} formations including the archive, {len(live)} live")
+
+    def test_18_optimize_formation(self):
+        """Test the optimal XI endpoint"""
+        print("\n=== Testing Formation Optimizer ===")
+        
+        response = requests.post(f"{API_URL}/formations/optimize", json={"formation_name": "4-3-3"})
+        self.assertEqual(response.status_code, 200)
+        optimized = response.json()
+        self.assertEqual(len(optimized["players"]), 11)
+        chosen = [slot["player"] for slot in optimized["players"] if slot["player"]]
+        self.assertEqual(len({p["id"] for p in chosen}), len(chosen))
+        self.assertEqual(optimized["total_rating"], sum(p["rating"] for p in chosen))
+        print(f"✅ Optimal 4-3-3 with {len(chosen)} players, total rating {optimized['total_rating']}")
+        
+        # A locked player keeps their slot and is not picked again
+        goalkeeper = next(slot["player"] for slot in optimized["players"] if slot["position_slot"] == "GK")
+        if goalkeeper:
+            response = requests.post(f"{API_URL}/formations/optimize", json={
+                "formation_name": "4-3-3",
+                "locked": {"ST": goalkeeper["id"]},
+            })
+            self.assertEqual(response.status_code, 200)
+            slots = {slot["position_slot"]: slot for slot in response.json()["players"]}
+            self.assertTrue(slots["ST"]["locked"])
+            self.assertEqual(slots["ST"]["player"]["id"], goalkeeper["id"])
+            others = [slot["player"]["id"] for name, slot in slots.items() if name != "ST" and slot["player"]]
+            self.assertNotIn(goalkeeper["id"], others)
+            print("✅ Locked slot kept and its player not reused")
+        
+        response = requests.post(f"{API_URL}/formations/optimize", json={"formation_name": "3-5-2"})
+        self.assertEqual(response.status_code, 400)
+        response = requests.post(f"{API_URL}/formations/optimize", json={"formation_name": "4-3-3", "locked": {"XX": "a"}})
+        self.assertEqual(response.status_code, 400)
+        response = requests.post(f"{API_URL}/formations/optimize", json={"formation_name": "4-3-3", "theme": "No Such Theme"})
+        self.assertEqual(response.status_code, 404)
+        print("✅ Unknown formation, slot and theme rejected")
+
 if __name__ == "__main__":
     # Run the tests
     unittest.main(argv=['first-arg-is-ignored'], exit=False)
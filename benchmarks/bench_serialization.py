@@ -0,0 +1,100 @@
+"""Micro-benchmark: FastAPI response_model path vs. the trusted orjson path.
+
+Run from the repository root:
+
+    python benchmarks/bench_serialization.py [--rows 1000 10000] [--repeat 5]
+
+The "response_model" column reproduces what FastAPI does for a route that
+builds models and declares `response_model=List[Model]`: construct the models,
+dump them back to dicts, re-validate them, serialize them in JSON mode and
+encode the result with the stdlib json module. The "trusted" column is
+`TrustedJSONResponse` on the raw Mongo documents.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from serialization import TrustedJSONResponse  # noqa: E402
+from server import Formation, FormationPlayer, Player  # noqa: E402
+
+POSITIONS = ["GK", "CB", "LB", "RB", "DM", "CM", "AM", "LW", "RW", "ST"]
+ERAS = ["1970s", "1980s", "1990s", "2000s", "2010s", "2020s"]
+
+
+def make_players(n: int) -> List[dict]:
+    return [
+        Player(
+            name=f"Player {i}",
+            position=random.choice(POSITIONS),
+            club=f"Club {i % 200}",
+            country=f"Country {i % 60}",
+            rating=random.randint(50, 99),
+            image_url=f"https://example.com/players/{i}.jpg",
+            achievements=[f"Trophy {j}" for j in range(i % 4)],
+            era=random.choice(ERAS),
+            description="Lorem ipsum dolor sit amet " * 3,
+        ).dict()
+        for i in range(n)
+    ]
+
+
+def make_formations(n: int) -> List[dict]:
+    return [
+        Formation(
+            user_name=f"user{i}",
+            formation_name="4-3-3",
+            theme="Leyendas",
+            players=[FormationPlayer(player_id=f"p{i}-{j}", position_slot=f"S{j}") for j in range(11)],
+            votes=random.randint(0, 10000),
+        ).dict()
+        for i in range(n)
+    ]
+
+
+def response_model_path(model, docs: List[dict]) -> bytes:
+    adapter = TypeAdapter(List[model])
+    models = [model(**doc) for doc in docs]
+    prepared = [m.model_dump(by_alias=True) for m in models]
+    value = adapter.validate_python(prepared)
+    content = adapter.dump_python(value, mode="json", by_alias=True)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def trusted_path(docs: List[dict]) -> bytes:
+    return TrustedJSONResponse(docs).body
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'dataset':<12}{'rows':>8}{'response_model ms':>20}{'trusted ms':>14}{'speedup':>10}")
+    for name, model, factory in (("players", Player, make_players), ("formations", Formation, make_formations)):
+        for rows in args.rows:
+            docs = factory(rows)
+            slow = best_of(lambda: response_model_path(model, docs), args.repeat)
+            fast = best_of(lambda: trusted_path(docs), args.repeat)
+            print(f"{name:<12}{rows:>8}{slow * 1000:>20.2f}{fast * 1000:>14.2f}{slow / fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
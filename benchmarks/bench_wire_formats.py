@@ -0,0 +1,56 @@
+"""Micro-benchmark: payload size and encode time per wire format and content-coding.
+
+Run from the repository root:
+
+    python benchmarks/bench_wire_formats.py [--rows 1000 10000] [--repeat 5]
+
+Each row encodes a `get_players` / `get_formations` page of raw Mongo
+documents as JSON, MessagePack and columnar JSON, then compresses it the way
+`CompressionMiddleware` would. Brotli rows are skipped when the `brotli`
+package is not installed.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_serialization import best_of, make_formations, make_players  # noqa: E402
+from compression import brotli, compress  # noqa: E402
+from serialization import columnar, dumps, packb  # noqa: E402
+
+FORMATS = {
+    "json": dumps,
+    "msgpack": packb,
+    "columnar": lambda docs: dumps(columnar(docs)),
+}
+ENCODINGS = ["identity", "gzip"] + (["br"] if brotli is not None else [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'dataset':<12}{'rows':>7}{'format':>10}{'coding':>10}{'bytes':>12}{'vs json':>9}{'encode ms':>11}")
+    for name, factory in (("players", make_players), ("formations", make_formations)):
+        for rows in args.rows:
+            docs = factory(rows)
+            baseline = len(dumps(docs))
+            for wire_format, encode in FORMATS.items():
+                body = encode(docs)
+                for encoding in ENCODINGS:
+                    if encoding == "identity":
+                        payload = body
+                        elapsed = best_of(lambda: encode(docs), args.repeat)
+                    else:
+                        payload = compress(body, encoding)
+                        elapsed = best_of(lambda: compress(encode(docs), encoding), args.repeat)
+                    print(f"{name:<12}{rows:>7}{wire_format:>10}{encoding:>10}{len(payload):>12}"
+                          f"{len(payload) / baseline:>8.0%}{elapsed * 1000:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
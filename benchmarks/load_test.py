@@ -0,0 +1,371 @@
+"""Load test for the /api routes, driven in-process through ASGI.
+
+The FastAPI app is imported from backend/server.py and called through
+httpx's ASGI transport, so no uvicorn or network hop is involved. Data lives
+either in a local mongod (default, database `dream11_bench`, dropped and
+reseeded on every run) or in memory via the optional `mongomock-motor`
+package.
+
+    python benchmarks/load_test.py --players 100000 --formations 1000000
+    python benchmarks/load_test.py --save-baseline benchmarks/baseline.json
+    python benchmarks/load_test.py --baseline benchmarks/baseline.json --fail-on-regression
+
+The traffic mix follows the frontend: `initializeApp` (init-data, players,
+facets, themes, formations, daily theme), filter changes and search in the
+player picker, the optimizer, saving formations, voting, the rankings views
+(by theme, quality, trending and archive) and their SSE stream. Occasional
+theme creations and bulk player imports add write load. Only the health
+probes and the WebSocket form of the stream are left out. The stream is timed
+to its first event, since it never ends.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote_plus
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+POSITIONS = ["GK", "CB", "LB", "RB", "DM", "CM", "AM", "LW", "RW", "ST"]
+ERAS = ["1960s", "1970s", "1980s", "1990s", "2000s", "2010s", "2020s"]
+SLOTS = ["GK", "CB1", "CB2", "LB", "RB", "CM1", "CM2", "CM3", "LW", "RW", "ST"]
+SEED_BATCH = 10000
+HOT_FORMATIONS = 1000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="In-process load test for the /api routes")
+    parser.add_argument("--backend", choices=["mongod", "memory"], default="mongod")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="dream11_bench")
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--formations", type=int, default=1000)
+    parser.add_argument("--themes", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data of a previous run")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--baseline", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed relative p95 regression before a route is flagged")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser.parse_args()
+
+
+def import_server(args):
+    # server.py reads its configuration at import time
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    # Every simulated user shares one client address; measure the routes, not the abuse guards
+    os.environ.setdefault("VOTE_DEDUP_ENABLED", "0")
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+    if args.backend == "memory":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("--backend memory needs the mongomock-motor package")
+        import motor.motor_asyncio
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    import server
+    return server
+
+
+async def seed(server, args, rng):
+    db = server.db
+    for name in ("players", "formations", "themes"):
+        await db[name].drop()
+
+    started = time.perf_counter()
+    player_ids = []
+    player_stats = {}
+    batch = []
+    for i in range(args.players):
+        player = server.Player(
+            name=f"Bench Player {i}",
+            position=rng.choice(POSITIONS),
+            club=f"Club {i % 500}",
+            country=f"Country {i % 80}",
+            rating=rng.randint(40, 99),
+            image_url=f"https://example.com/players/{i}.jpg",
+            achievements=[f"Trophy {j}" for j in range(i % 4)],
+            era=rng.choice(ERAS),
+            description="Benchmark player",
+        )
+        player_ids.append(player.id)
+        player_stats[player.id] = {"rating": player.rating, "country": player.country, "era": player.era}
+        batch.append(player.dict())
+        if len(batch) >= SEED_BATCH:
+            await db.players.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.players.insert_many(batch, ordered=False)
+
+    themes = [f"Bench Theme {i}" for i in range(args.themes)]
+    await db.themes.insert_many([
+        server.Theme(name=name, description="Benchmark theme", filter_criteria={}, is_daily=False).dict()
+        for name in themes
+    ])
+
+    formation_ids = []
+    batch = []
+    for i in range(args.formations):
+        formation = {
+            "id": str(uuid.uuid4()),
+            "user_name": f"bench{i}",
+            "formation_name": "4-3-3",
+            "theme": themes[i % len(themes)],
+            "players": [{"player_id": rng.choice(player_ids), "position_slot": slot} for slot in SLOTS],
+            "created_at": datetime.utcnow(),
+            "votes": rng.randint(0, 1000),
+        }
+        # Seeded like create_formation, so startup has no aggregates to backfill
+        formation.update(server.formation_aggregates(formation["formation_name"], formation["players"], player_stats))
+        if i < HOT_FORMATIONS:
+            formation_ids.append(formation["id"])
+        batch.append(formation)
+        if len(batch) >= SEED_BATCH:
+            await db.formations.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.formations.insert_many(batch, ordered=False)
+
+    print(f"Seeded {args.players} players, {args.formations} formations, {len(themes)} themes "
+          f"in {time.perf_counter() - started:.1f}s")
+    return player_ids[:HOT_FORMATIONS], formation_ids, themes
+
+
+async def load_existing(server):
+    db = server.db
+    player_ids = [d["id"] async for d in db.players.find({}, {"id": 1}).limit(HOT_FORMATIONS)]
+    formation_ids = [d["id"] async for d in db.formations.find({}, {"id": 1}).limit(HOT_FORMATIONS)]
+    themes = await db.formations.distinct("theme")
+    return player_ids, formation_ids, themes
+
+
+def new_formation(rng, player_ids, themes):
+    return {
+        "user_name": "Bench User",
+        "formation_name": "4-3-3",
+        "theme": rng.choice(themes),
+        "players": [{"player_id": rng.choice(player_ids), "position_slot": slot} for slot in SLOTS],
+    }
+
+
+def bulk_players(rng, count=100):
+    # Upserted on a bounded set of names, so repeated imports do not grow the catalog
+    lines = []
+    for _ in range(count):
+        i = rng.randrange(1000)
+        lines.append(json.dumps({
+            "name": f"Bulk Player {i}", "position": rng.choice(POSITIONS), "club": f"Club {i % 500}",
+            "country": f"Country {i % 80}", "rating": rng.randint(40, 99), "image_url": "", "era": rng.choice(ERAS),
+        }))
+    return "\n".join(lines).encode()
+
+
+def traffic_mix(player_ids, formation_ids, themes):
+    """(weight, route template, request factory) for every scenario step.
+
+    A factory returns (method, url) or (method, url, options): httpx request
+    keyword arguments, plus `stream=True` for endpoints timed to their first chunk.
+    """
+    return [
+        (2, "POST /api/init-data", lambda rng: ("POST", "/api/init-data")),
+        (20, "GET /api/players", lambda rng: ("GET", "/api/players")),
+        (10, "GET /api/players?position", lambda rng: ("GET", f"/api/players?position={rng.choice(POSITIONS)}")),
+        (5, "GET /api/players?min_rating", lambda rng: ("GET", f"/api/players?min_rating={rng.randint(70, 95)}")),
+        (5, "GET /api/players?theme", lambda rng: ("GET", f"/api/players?theme={rng.choice(themes)}")),
+        (8, "GET /api/players/{player_id}", lambda rng: ("GET", f"/api/players/{rng.choice(player_ids)}")),
+        (8, "GET /api/players/search", lambda rng: ("GET", f"/api/players/search?q=bench+player+{rng.randrange(100)}")),
+        (5, "GET /api/players/facets", lambda rng: ("GET", "/api/players/facets")),
+        (1, "POST /api/players/bulk", lambda rng: (
+            "POST", "/api/players/bulk?mode=upsert",
+            {"content": bulk_players(rng), "headers": {"Content-Type": "application/x-ndjson"}},
+        )),
+        (10, "GET /api/themes", lambda rng: ("GET", "/api/themes")),
+        (10, "GET /api/themes/daily", lambda rng: ("GET", "/api/themes/daily")),
+        (1, "POST /api/themes", lambda rng: ("POST", "/api/themes", {"json": {
+            "name": f"Bench Theme {rng.randrange(5)}", "description": "Benchmark theme",
+            "filter_criteria": {"era": rng.choice(ERAS)},
+        }})),
+        (10, "GET /api/formations", lambda rng: ("GET", "/api/formations")),
+        (15, "GET /api/formations?theme", lambda rng: ("GET", f"/api/formations?theme={rng.choice(themes)}")),
+        (4, "GET /api/formations?sort", lambda rng: (
+            "GET", f"/api/formations?sort={rng.choice(['total_rating', 'avg_rating'])}&era={rng.choice(ERAS)}",
+        )),
+        (2, "GET /api/formations?include_archived", lambda rng: ("GET", "/api/formations?include_archived=true")),
+        (3, "GET /api/formations?expand=players", lambda rng: ("GET", "/api/formations?expand=players")),
+        (4, "GET /api/formations/trending", lambda rng: (
+            "GET", f"/api/formations/trending?window={rng.choice(['1h', '24h', '7d'])}",
+        )),
+        (2, "GET /api/formations/stream", lambda rng: (
+            "GET", f"/api/formations/stream?theme={quote_plus(rng.choice(themes))}", {"stream": True},
+        )),
+        (3, "POST /api/formations/optimize", lambda rng: (
+            "POST", "/api/formations/optimize", {"json": {"formation_name": rng.choice(["4-3-3", "4-4-2"])}},
+        )),
+        (3, "POST /api/formations", lambda rng: ("POST", "/api/formations", {"json": new_formation(rng, player_ids, themes)})),
+        (15, "PUT /api/formations/{formation_id}/vote",
+         lambda rng: ("PUT", f"/api/formations/{rng.choice(formation_ids)}/vote")),
+        (2, "GET /api/votes/stats", lambda rng: ("GET", "/api/votes/stats")),
+    ]
+
+
+async def first_chunk(app, url) -> int:
+    """Call a streaming endpoint until its first body chunk, then disconnect; returns the status.
+
+    httpx's ASGI transport waits for the whole body, which a stream never finishes.
+    """
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1234), "server": ("bench", 80),
+    }
+    received = asyncio.Event()
+    status = 0
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await received.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and (message.get("body") or not message.get("more_body")):
+            received.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_load(server, args, rng, mix):
+    import httpx
+
+    weights = [weight for weight, _, _ in mix]
+    plan = [rng.choices(mix, weights)[0] for _ in range(args.requests)]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    queue = asyncio.Queue()
+    for step in plan:
+        queue.put_nowait(step)
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker(worker_rng):
+            while not queue.empty():
+                _, route, factory = queue.get_nowait()
+                method, url, *options = factory(worker_rng)
+                options = dict(options[0]) if options else {}
+                started = time.perf_counter()
+                if options.pop("stream", False):
+                    status = await first_chunk(server.app, url)
+                else:
+                    status = (await client.request(method, url, **options)).status_code
+                latencies[route].append(time.perf_counter() - started)
+                if status >= 400:
+                    errors[route] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(random.Random(rng.random())) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    report = {}
+    for route, values in sorted(latencies.items()):
+        values.sort()
+        report[route] = {
+            "count": len(values),
+            "errors": errors[route],
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "rps": len(values) / elapsed,
+        }
+    return report, elapsed
+
+
+def print_report(report, elapsed, baseline=None):
+    header = f"{'route':<42}{'count':>7}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}"
+    if baseline:
+        header += f"{'p95 vs base':>13}"
+    print(header)
+    total = 0
+    for route, stats in report.items():
+        total += stats["count"]
+        line = (f"{route:<42}{stats['count']:>7}{stats['errors']:>5}{stats['p50_ms']:>9.2f}"
+                f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}{stats['rps']:>9.0f}")
+        base = (baseline or {}).get(route)
+        if base:
+            line += f"{(stats['p95_ms'] / base['p95_ms'] - 1) * 100:>+12.1f}%"
+        print(line)
+    print(f"{total} requests in {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+
+
+def regressions(report, baseline, tolerance):
+    return [
+        route for route, stats in report.items()
+        if route in baseline and stats["p95_ms"] > baseline[route]["p95_ms"] * (1 + tolerance)
+    ]
+
+
+async def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    server = import_server(args)
+
+    if args.skip_seed:
+        ids = await load_existing(server)
+    else:
+        ids = await seed(server, args, rng)
+
+    # httpx does not send lifespan events; run the app's startup hooks ourselves
+    started = time.perf_counter()
+    await server.app.router.startup()
+    print(f"Startup took {time.perf_counter() - started:.2f}s")
+    try:
+        report, elapsed = await run_load(server, args, rng, traffic_mix(*ids))
+    finally:
+        await server.app.router.shutdown()
+
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())["routes"]
+    print_report(report, elapsed, baseline)
+
+    if args.save_baseline:
+        meta = {k: getattr(args, k) for k in ("backend", "players", "formations", "themes", "requests", "concurrency")}
+        Path(args.save_baseline).write_text(json.dumps({"meta": meta, "routes": report}, indent=2))
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if baseline:
+        slower = regressions(report, baseline, args.tolerance)
+        if slower:
+            print(f"p95 regressed beyond {args.tolerance:.0%}: {', '.join(slower)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
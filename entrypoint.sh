@@ -4,18 +4,44 @@ set -e
 # Start the FastAPI backend
 cd /backend || { echo "Backend directory not found"; exit 1; }
 
-echo "Starting FastAPI backend"
+# BACKEND_WORKERS=N runs N uvicorn workers ("auto" = one per core). The workers keep
+# their caches coherent through version counters in shared memory.
+WORKERS="${BACKEND_WORKERS:-1}"
+if [ "$WORKERS" = "auto" ]; then
+    WORKERS=$(nproc)
+fi
+if [ "$WORKERS" -gt 1 ]; then
+    export CACHE_COHERENCE="${CACHE_COHERENCE:-shm}"
+    # Every worker writes its metrics here so /metrics can aggregate them; stale files from
+    # a previous run would be counted again, so start from an empty directory
+    export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-multiproc}"
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+echo "Starting FastAPI backend with $WORKERS worker(s)"
 # Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
+uvicorn server:app --host 0.0.0.0 --port 8001 --workers "$WORKERS" &
 BACKEND_PID=$!
 
-echo "Waiting for backend to start..."
-sleep 30
-
-if ! kill -0 $BACKEND_PID 2>/dev/null; then
-    echo "Backend failed to start at initialization, exiting"
-    exit 1
-fi
+# Wait until /api/readyz answers 200: Mongo reachable, indexes reconciled, caches warm
+READY_TIMEOUT="${READY_TIMEOUT:-120}"
+echo "Waiting up to ${READY_TIMEOUT}s for backend readiness..."
+WAITED=0
+until wget -q -O /dev/null http://127.0.0.1:8001/api/readyz 2>/dev/null; do
+    if ! kill -0 $BACKEND_PID 2>/dev/null; then
+        echo "Backend failed to start at initialization, exiting"
+        exit 1
+    fi
+    if [ "$WAITED" -ge "$READY_TIMEOUT" ]; then
+        echo "Backend not ready after ${READY_TIMEOUT}s, exiting"
+        kill $BACKEND_PID
+        exit 1
+    fi
+    sleep 1
+    WAITED=$((WAITED + 1))
+done
+echo "Backend ready after ~${WAITED}s"
 
 # Start Nginx
 nginx -g 'daemon off;' &
@@ -135,7 +135,7 @@ const FootballField = ({ formation, assignedPlayers, onDrop, onRemovePlayer }) =
 
 const App = () => {
   const [players, setPlayers] = useState([]);
-  const [allPlayers, setAllPlayers] = useState([]);
+  const [facets, setFacets] = useState({});
   const [currentTheme, setCurrentTheme] = useState(null);
   const [availableThemes, setAvailableThemes] = useState([]);
   const [selectedFormation, setSelectedFormation] = useState("4-3-3");
@@ -159,6 +159,34 @@ const App = () => {
     initializeApp();
   }, []);
 
+  // Live vote counts and new formations for the theme on screen while the rankings are shown
+  useEffect(() => {
+    if (currentView !== 'rankings') return undefined;
+    const params = currentTheme?.name ? `?theme=${encodeURIComponent(currentTheme.name)}` : '';
+    const source = new EventSource(`${API}/formations/stream${params}`);
+    source.addEventListener('votes', (event) => {
+      const { deltas, votes } = JSON.parse(event.data);
+      setSavedFormations(formations => formations
+        .map(formation => {
+          if (votes[formation.id] !== undefined) return { ...formation, votes: votes[formation.id] };
+          if (deltas[formation.id]) return { ...formation, votes: formation.votes + deltas[formation.id] };
+          return formation;
+        })
+        .sort((a, b) => b.votes - a.votes));
+    });
+    source.addEventListener('created', (event) => {
+      const { formation } = JSON.parse(event.data);
+      setSavedFormations(formations => (
+        formations.some(existing => existing.id === formation.id)
+          ? formations
+          : [...formations, formation].sort((a, b) => b.votes - a.votes)
+      ));
+    });
+    source.addEventListener('resync', () => loadFormations(currentTheme?.name));
+    return () => source.close();
+    // Reopen the stream on theme changes: it is scoped to the theme on screen
+  }, [currentView, currentTheme?.name]);
+
   const initializeApp = async () => {
     try {
       // Initialize sample data
@@ -167,6 +195,7 @@ const App = () => {
       // Load players, themes, and formations
       await Promise.all([
         loadPlayers(),
+        loadFacets(),
         loadThemes(),
         loadFormations(),
         loadDailyTheme()
@@ -184,22 +213,27 @@ const App = () => {
       if (filters.position) params.append('position', filters.position);
       if (filters.club) params.append('club', filters.club);
       if (filters.era) params.append('era', filters.era);
+      if (filters.country) params.append('country', filters.country);
+      if (filters.minRating) params.append('min_rating', filters.minRating);
+      if (filters.theme) params.append('theme', filters.theme);
       
       const response = await axios.get(`${API}/players?${params.toString()}`);
-      const allPlayersData = response.data;
       
-      // Apply rating filter on frontend
-      const filteredPlayers = allPlayersData.filter(player => 
-        player.rating >= (filters.minRating || 0)
-      );
-      
-      setAllPlayers(allPlayersData);
-      setPlayers(filteredPlayers);
+      setPlayers(response.data);
     } catch (error) {
       console.error('Error loading players:', error);
     }
   };
 
+  const loadFacets = async () => {
+    try {
+      const response = await axios.get(`${API}/players/facets`);
+      setFacets(response.data);
+    } catch (error) {
+      console.error('Error loading facets:', error);
+    }
+  };
+
   const loadThemes = async () => {
     try {
       const response = await axios.get(`${API}/themes`);
@@ -223,22 +257,15 @@ const App = () => {
     try {
       const response = await axios.get(`${API}/themes/daily`);
       setCurrentTheme(response.data);
-      // Apply theme filters if any
-      if (response.data.filter_criteria) {
-        applyThemeFilters(response.data.filter_criteria);
-      }
+      applyThemeFilters(response.data);
     } catch (error) {
       console.error('Error loading daily theme:', error);
     }
   };
 
-  const applyThemeFilters = (criteria) => {
-    const filters = { ...playerFilters };
-    if (criteria.club) filters.club = criteria.club;
-    if (criteria.country) filters.country = criteria.country;
-    if (criteria.era) filters.era = criteria.era;
-    if (criteria.position) filters.position = criteria.position;
-    
+  const applyThemeFilters = (theme) => {
+    // The backend applies the theme's criteria, whatever operators they use
+    const filters = { ...playerFilters, theme: theme.name };
     setPlayerFilters(filters);
     loadPlayers(filters);
   };
@@ -253,15 +280,8 @@ const App = () => {
     setCurrentTheme(theme);
     setShowThemeSelector(false);
     
-    // Apply theme filters
-    if (theme.filter_criteria) {
-      applyThemeFilters(theme.filter_criteria);
-    } else {
-      // Reset filters if no criteria
-      const resetFilters = { position: '', club: '', era: '', minRating: 0 };
-      setPlayerFilters(resetFilters);
-      loadPlayers(resetFilters);
-    }
+    // Restrict the picker to the theme's eligible players
+    applyThemeFilters(theme);
     
     // Load formations for this theme
     loadFormations(theme.name);
@@ -269,12 +289,18 @@ const App = () => {
 
   const voteForFormation = async (formationId) => {
     try {
+      // The new count arrives through the live stream
       await axios.put(`${API}/formations/${formationId}/vote`);
-      // Reload formations to see updated votes
-      loadFormations(currentTheme?.name);
     } catch (error) {
       console.error('Error voting for formation:', error);
-      alert('Error al votar');
+      const status = error.response?.status;
+      if (status === 409) {
+        alert('Ya has votado por esta formación hoy');
+      } else if (status === 429) {
+        alert('Demasiadas peticiones, inténtalo de nuevo en unos segundos');
+      } else {
+        alert('Error al votar');
+      }
     }
   };
 
@@ -405,7 +431,7 @@ const App = () => {
   );
 
   const getUniqueValues = (field) => {
-    return [...new Set(allPlayers.map(player => player[field]))].filter(Boolean);
+    return (facets[field] || []).map(facet => facet.value);
   };
 
   if (loading) {
@@ -612,6 +638,7 @@ const App = () => {
                     </div>
                     <div className="formation-players">
                       <p>Jugadores: {formation.players.length}/11</p>
+                      <p>Valoración media: {formation.avg_rating}</p>
                       <small>Tema: {formation.theme}</small>
                     </div>
                   </div>
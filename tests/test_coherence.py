@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from coherence import SharedCounters, SharedVoteLog, theme_hash
+from etags import CollectionVersions
+from vote_dedup import SharedDailyBloomFilter
+
+NAMES = ("players", "formations")
+
+
+def _bump(path, times):
+    counters = SharedCounters(path, NAMES)
+    for _ in range(times):
+        counters.increment("formations")
+    counters.close()
+
+
+def _append_votes(path, formation_id, votes):
+    log = SharedVoteLog(path, capacity=8)
+    log.append(formation_id, "Theme", votes)
+    log.close()
+
+
+def _vote(path, client, formation_id, results):
+    dedup = SharedDailyBloomFilter(path, capacity=1000)
+    results.put(dedup.add(client, formation_id))
+    dedup.close()
+
+
+def _run(target, *args):
+    process = multiprocessing.get_context("fork").Process(target=target, args=args)
+    process.start()
+    process.join()
+    return process.exitcode
+
+
+class SharedMemoryTestCase(unittest.TestCase):
+    def path(self, name):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return os.path.join(directory.name, name)
+
+
+class SharedCountersTest(SharedMemoryTestCase):
+    def test_increments_from_other_processes_are_visible(self):
+        path = self.path("versions")
+        counters = SharedCounters(path, NAMES)
+        self.addCleanup(counters.close)
+        processes = [multiprocessing.get_context("fork").Process(target=_bump, args=(path, 50)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(counters.get("formations"), 200)
+        self.assertEqual(counters.get("players"), 0)
+
+    def test_workers_share_one_epoch(self):
+        path = self.path("versions")
+        first, second = SharedCounters(path, NAMES), SharedCounters(path, NAMES)
+        self.addCleanup(first.close)
+        self.addCleanup(second.close)
+        self.assertEqual(first.epoch, second.epoch)
+
+    def test_sync_reports_collections_bumped_elsewhere(self):
+        path = self.path("versions")
+        shared = SharedCounters(path, NAMES)
+        self.addCleanup(shared.close)
+        versions = CollectionVersions(NAMES, shared=shared)
+        before = versions.etag(["formations"], b"")
+        self.assertEqual(_run(_bump, path, 1), 0)
+        self.assertEqual(versions.sync(), ["formations"])
+        self.assertEqual(versions.sync(), [])
+        self.assertNotEqual(versions.etag(["formations"], b""), before)
+        # Own bumps are adopted directly and not reported again
+        versions.bump("players")
+        self.assertEqual(versions.sync(), [])
+
+
+class SharedVoteLogTest(SharedMemoryTestCase):
+    def test_reads_records_appended_by_other_processes(self):
+        path = self.path("votes")
+        log = SharedVoteLog(path, capacity=8)
+        self.addCleanup(log.close)
+        self.assertEqual(_run(_append_votes, path, "formation-1", 3), 0)
+        self.assertEqual(_run(_append_votes, path, "formation-2", 5), 0)
+        self.assertEqual(log.read_new(), [("formation-1", 3, theme_hash("Theme")), ("formation-2", 5, theme_hash("Theme"))])
+        self.assertEqual(log.read_new(), [])
+
+    def test_reports_an_overrun_ring(self):
+        path = self.path("votes")
+        reader = SharedVoteLog(path, capacity=4)
+        writer = SharedVoteLog(path, capacity=4)
+        self.addCleanup(reader.close)
+        self.addCleanup(writer.close)
+        for votes in range(5):
+            writer.append("formation", None, votes)
+        self.assertIsNone(reader.read_new())
+        writer.append("formation", None, 9)
+        self.assertEqual(reader.read_new(), [("formation", 9, theme_hash(None))])
+
+
+class SharedDailyBloomFilterTest(SharedMemoryTestCase):
+    def test_a_vote_counts_once_across_processes(self):
+        path = self.path("dedup")
+        dedup = SharedDailyBloomFilter(path, capacity=1000)
+        self.addCleanup(dedup.close)
+        results = multiprocessing.get_context("fork").Queue()
+        for _ in range(3):
+            self.assertEqual(_run(_vote, path, "1.2.3.4", "f1", results), 0)
+        self.assertEqual(sorted(results.get() for _ in range(3)), [False, False, True])
+        self.assertTrue(dedup.seen("1.2.3.4", "f1"))
+        self.assertFalse(dedup.add("1.2.3.4", "f1"))
+        self.assertEqual(dedup.stats()["votes_today"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from pymongo.errors import DuplicateKeyError
+
+import daily_theme
+from daily_theme import DailyThemeResolver
+
+
+class FakeThemes:
+    def __init__(self, stored=None, upsert_error=None):
+        self.stored = stored
+        self.upsert_error = upsert_error
+        self.finds = 0
+        self.upserts = 0
+
+    async def find_one(self, query, projection=None):
+        self.finds += 1
+        await asyncio.sleep(0)
+        if "daily_key" in query:
+            return {"name": "Winner", "daily_key": query["daily_key"]}
+        return self.stored
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        self.upserts += 1
+        if self.upsert_error:
+            raise self.upsert_error
+        return {**update["$setOnInsert"]}
+
+
+class FrozenDatetime(datetime):
+    now_value = datetime(2026, 1, 1, 12)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.now_value
+
+
+class DailyThemeResolverTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(daily_theme, "datetime", FrozenDatetime)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        FrozenDatetime.now_value = datetime(2026, 1, 1, 12)
+
+    async def test_resolves_once_per_day(self):
+        themes = FakeThemes(stored={"name": "Stored"})
+        resolver = DailyThemeResolver(themes, build_default=lambda: {"name": "Default"})
+        self.assertEqual((await resolver.get())["name"], "Stored")
+        await resolver.get()
+        self.assertEqual(themes.finds, 1)
+        FrozenDatetime.now_value = datetime(2026, 1, 2, 0, 0, 1)
+        await resolver.get()
+        self.assertEqual(themes.finds, 2)
+
+    async def test_concurrent_callers_share_one_resolution(self):
+        themes = FakeThemes(stored={"name": "Stored"})
+        resolver = DailyThemeResolver(themes, build_default=lambda: {"name": "Default"})
+        results = await asyncio.gather(*(resolver.get() for _ in range(10)))
+        self.assertTrue(all(theme["name"] == "Stored" for theme in results))
+        self.assertEqual(themes.finds, 1)
+
+    async def test_creates_the_default_with_a_daily_key(self):
+        themes = FakeThemes()
+        created = []
+        resolver = DailyThemeResolver(themes, build_default=lambda: {"name": "Default"},
+                                      on_create=lambda: created.append(True))
+        theme = await resolver.get()
+        self.assertEqual(theme, {"name": "Default", "daily_key": "2026-01-01"})
+        self.assertEqual(created, [True])
+
+    async def test_a_lost_upsert_race_reads_the_winner(self):
+        themes = FakeThemes(upsert_error=DuplicateKeyError("dup"))
+        resolver = DailyThemeResolver(themes, build_default=lambda: {"name": "Default"})
+        self.assertEqual((await resolver.get())["name"], "Winner")
+
+    async def test_invalidate_forces_a_new_resolution(self):
+        themes = FakeThemes(stored={"name": "Stored"})
+        resolver = DailyThemeResolver(themes, build_default=lambda: {"name": "Default"})
+        await resolver.get()
+        resolver.invalidate()
+        await resolver.get()
+        self.assertEqual(themes.finds, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
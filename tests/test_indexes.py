@@ -0,0 +1,78 @@
+import unittest
+
+from pymongo import ASCENDING, IndexModel
+
+from indexes import reconcile_indexes
+
+
+class FakeCollection:
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.dropped = []
+        self.created = []
+
+    async def index_information(self):
+        return self.indexes
+
+    async def drop_index(self, name):
+        self.dropped.append(name)
+
+    async def create_indexes(self, models):
+        self.created.extend(model.document["name"] for model in models)
+
+
+class FakeDatabase:
+    def __init__(self, collections):
+        self.collections = collections
+        self.commands = []
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+    async def command(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+
+
+def ttl_index(seconds):
+    return IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=seconds)
+
+
+class ReconcileIndexesTest(unittest.IsolatedAsyncioTestCase):
+    async def reconcile(self, existing, models):
+        collection = FakeCollection(existing)
+        db = FakeDatabase({"things": collection})
+        await reconcile_indexes(db, {"things": models})
+        return collection, db
+
+    async def test_creates_missing_indexes(self):
+        collection, _ = await self.reconcile({}, [ttl_index(0)])
+        self.assertEqual(collection.created, ["expires_at_ttl"])
+
+    async def test_leaves_matching_indexes_alone(self):
+        existing = {"expires_at_ttl": {"key": [("expires_at", 1)], "v": 2, "expireAfterSeconds": 0}}
+        collection, db = await self.reconcile(existing, [ttl_index(0)])
+        self.assertEqual((collection.created, collection.dropped, db.commands), ([], [], []))
+
+    async def test_changes_a_ttl_in_place(self):
+        existing = {"expires_at_ttl": {"key": [("expires_at", 1)], "v": 2, "expireAfterSeconds": 0}}
+        collection, db = await self.reconcile(existing, [ttl_index(3600)])
+        self.assertEqual(collection.dropped, [])
+        self.assertEqual(db.commands, [(("collMod", "things"), {"index": {"name": "expires_at_ttl", "expireAfterSeconds": 3600}})])
+
+    async def test_rebuilds_when_the_partial_filter_changes(self):
+        existing = {"daily": {"key": [("daily_key", 1)], "v": 2, "unique": True,
+                              "partialFilterExpression": {"daily_key": {"$exists": True}}}}
+        model = IndexModel([("daily_key", ASCENDING)], name="daily", unique=True,
+                           partialFilterExpression={"daily_key": {"$type": "string"}})
+        collection, _ = await self.reconcile(existing, [model])
+        self.assertEqual(collection.dropped, ["daily"])
+        self.assertEqual(collection.created, ["daily"])
+
+    async def test_rebuilds_when_ttl_is_added(self):
+        existing = {"expires_at_ttl": {"key": [("expires_at", 1)], "v": 2}}
+        collection, _ = await self.reconcile(existing, [ttl_index(0)])
+        self.assertEqual(collection.dropped, ["expires_at_ttl"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from dataclasses import dataclass, replace
+
+from leaderboard import Leaderboard
+
+
+@dataclass
+class Entry:
+    id: str
+    theme: str
+    votes: int = 0
+
+    def model_copy(self, update):
+        return replace(self, **update)
+
+
+def ranking(board, theme=None):
+    return [(entry.id, entry.votes) for entry in board.top(theme)]
+
+
+class LeaderboardTest(unittest.TestCase):
+    def test_orders_by_votes_then_id(self):
+        board = Leaderboard(size=3)
+        for entry in (Entry("b", "t", 2), Entry("a", "t", 2), Entry("c", "u", 5)):
+            board.offer(entry)
+        self.assertEqual(ranking(board), [("c", 5), ("a", 2), ("b", 2)])
+
+    def test_evicts_the_last_entry_when_full(self):
+        board = Leaderboard(size=2)
+        for entry in (Entry("a", "t", 3), Entry("b", "t", 2), Entry("c", "t", 1)):
+            board.offer(entry)
+        self.assertEqual(ranking(board), [("a", 3), ("b", 2)])
+        board.offer(Entry("c", "t", 4))
+        self.assertEqual(ranking(board), [("c", 4), ("a", 3)])
+
+    def test_reranks_when_votes_grow(self):
+        board = Leaderboard(size=2)
+        board.seed(None, [Entry("a", "t", 3), Entry("b", "t", 2)])
+        board.offer(Entry("b", "t", 5))
+        self.assertEqual(ranking(board), [("b", 5), ("a", 3)])
+
+    def test_ignores_an_offer_with_fewer_votes(self):
+        # Two votes whose updates come back out of order: the older count must not win
+        board = Leaderboard(size=2)
+        board.seed(None, [Entry("a", "t", 3), Entry("b", "t", 2)])
+        board.seed("t", [Entry("a", "t", 3), Entry("b", "t", 2)])
+        board.offer(Entry("b", "t", 5))
+        board.offer(Entry("b", "t", 4))
+        self.assertEqual(ranking(board), [("b", 5), ("a", 3)])
+        self.assertEqual(ranking(board, "t"), [("b", 5), ("a", 3)])
+
+    def test_offers_skip_unseeded_boards(self):
+        board = Leaderboard(size=2)
+        board.offer(Entry("a", "t", 1))
+        self.assertNotIn("t", board)
+        self.assertIsNone(board.top("t"))
+
+    def test_apply_votes_reranks_a_known_formation(self):
+        board = Leaderboard(size=2)
+        board.seed(None, [Entry("a", "t", 3), Entry("b", "u", 2)])
+        board.apply_votes("b", 7, lambda theme: theme == "u")
+        self.assertEqual(ranking(board), [("b", 7), ("a", 3)])
+        board.apply_votes("b", 6, lambda theme: theme == "u")
+        self.assertEqual(ranking(board), [("b", 7), ("a", 3)])
+
+    def test_apply_votes_drops_boards_an_unknown_formation_would_enter(self):
+        board = Leaderboard(size=2)
+        board.seed(None, [Entry("a", "t", 3), Entry("b", "u", 2)])
+        board.seed("t", [Entry("a", "t", 3)])
+        board.seed("u", [Entry("b", "u", 2), Entry("d", "u", 2)])
+        board.apply_votes("c", 1, lambda theme: theme == "u")
+        # Overall and "u" are full with more votes; "t" is another theme
+        for theme in (None, "t", "u"):
+            self.assertIn(theme, board)
+        board.apply_votes("c", 4, lambda theme: theme == "u")
+        self.assertNotIn(None, board)
+        self.assertNotIn("u", board)
+        self.assertIn("t", board)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import itertools
+import random
+import unittest
+
+import numpy as np
+
+from optimizer import FORMATION_SLOTS, POSITION_COMPATIBILITY, hungarian, solve_xi
+
+
+def brute_force_cost(cost: np.ndarray) -> float:
+    n, m = cost.shape
+    return min(sum(cost[i, j] for i, j in enumerate(columns)) for columns in itertools.permutations(range(m), n))
+
+
+def player(player_id, position, rating):
+    return {"id": player_id, "position": position, "rating": rating}
+
+
+def total(xi):
+    return sum(p["rating"] for p in xi.values() if p)
+
+
+def brute_force_total(slots, candidates, compatibility):
+    """Best total over every way of giving each slot a distinct compatible candidate or nobody."""
+    slot_names = list(slots)
+    options = [
+        [None] + [c for c in candidates if c["position"] in compatibility.get(slots[slot], [])]
+        for slot in slot_names
+    ]
+    best = 0
+    for choice in itertools.product(*options):
+        chosen = [c["id"] for c in choice if c]
+        if len(chosen) == len(set(chosen)):
+            best = max(best, sum(c["rating"] for c in choice if c))
+    return best
+
+
+class HungarianTest(unittest.TestCase):
+    def test_matches_brute_force_on_random_matrices(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            n = rng.randint(1, 5)
+            m = rng.randint(n, 6)
+            cost = np.array([[rng.randint(-20, 20) for _ in range(m)] for _ in range(n)], dtype=float)
+            assignment = hungarian(cost)
+            self.assertEqual(len(set(assignment.tolist())), n)
+            self.assertAlmostEqual(cost[np.arange(n), assignment].sum(), brute_force_cost(cost))
+
+
+class SolveXITest(unittest.TestCase):
+    def test_no_slots(self):
+        self.assertEqual(solve_xi({}, [player("a", "ST", 90)]), {})
+
+    def test_no_candidates_leaves_every_slot_empty(self):
+        xi = solve_xi(FORMATION_SLOTS["4-3-3"], [])
+        self.assertEqual(set(xi), set(FORMATION_SLOTS["4-3-3"]))
+        self.assertTrue(all(p is None for p in xi.values()))
+
+    def test_too_few_candidates_fill_what_they_can(self):
+        candidates = [player("gk", "GK", 80), player("st", "ST", 85)]
+        xi = solve_xi(FORMATION_SLOTS["4-3-3"], candidates)
+        self.assertEqual(xi["GK"]["id"], "gk")
+        self.assertEqual(sum(p is not None for p in xi.values()), 2)
+        self.assertEqual(total(xi), 165)
+
+    def test_players_only_fill_compatible_slots(self):
+        slots = {"GK": "GK", "ST": "ST"}
+        xi = solve_xi(slots, [player("cb", "CB", 99), player("gk", "GK", 70)])
+        self.assertEqual(xi["GK"]["id"], "gk")
+        self.assertIsNone(xi["ST"])
+
+    def test_each_player_fills_one_slot(self):
+        slots = {"ST1": "ST", "ST2": "ST"}
+        xi = solve_xi(slots, [player("a", "ST", 90)])
+        self.assertEqual([p["id"] for p in xi.values() if p], ["a"])
+
+    def test_prefers_the_best_total_over_greedy_choices(self):
+        # Greedy, slot by slot, would give the striker to LW and leave ST empty
+        slots = {"LW": "LW", "ST": "ST"}
+        candidates = [player("s", "ST", 95), player("w", "LW", 60)]
+        xi = solve_xi(slots, candidates, {"LW": ["LW", "ST"], "ST": ["ST"]})
+        self.assertEqual(xi["LW"]["id"], "w")
+        self.assertEqual(xi["ST"]["id"], "s")
+        self.assertEqual(total(xi), 155)
+
+    def test_custom_compatibility_is_respected(self):
+        slots = {"CM": "CM"}
+        candidates = [player("am", "AM", 88), player("cm", "CM", 80)]
+        xi = solve_xi(slots, candidates, {"CM": ["CM"]})
+        self.assertEqual(xi["CM"]["id"], "cm")
+
+    def test_matches_brute_force_on_small_formations(self):
+        rng = random.Random(11)
+        positions = ["GK", "CB", "LB", "ST", "LW", "CM", "AM"]
+        slots = {"GK": "GK", "CB": "CB", "LB": "LB", "CM": "CM", "ST": "ST"}
+        for _ in range(100):
+            candidates = [
+                player(f"p{i}", rng.choice(positions), rng.randint(60, 99)) for i in range(rng.randint(0, 7))
+            ]
+            xi = solve_xi(slots, candidates)
+            ids = [p["id"] for p in xi.values() if p]
+            self.assertEqual(len(ids), len(set(ids)))
+            for slot, chosen in xi.items():
+                if chosen:
+                    self.assertIn(chosen["position"], POSITION_COMPATIBILITY[slots[slot]])
+            self.assertEqual(total(xi), brute_force_total(slots, candidates, POSITION_COMPATIBILITY))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+
+from player_cache import CatalogCache
+
+
+def loader_of(value, calls=None, gate=None):
+    async def load():
+        if calls is not None:
+            calls.append(value)
+        if gate is not None:
+            await gate.wait()
+        return value
+    return load
+
+
+class CatalogCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def test_hits_after_the_first_load(self):
+        cache = CatalogCache()
+        calls = []
+        self.assertEqual(await cache.get_or_load("k", loader_of("v", calls)), "v")
+        self.assertEqual(await cache.get_or_load("k", loader_of("other", calls)), "v")
+        self.assertEqual(calls, ["v"])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    async def test_evicts_least_recently_used_by_weight(self):
+        cache = CatalogCache(max_weight=5)
+        size = lambda value: len(value)
+        await cache.get_or_load("a", loader_of([1, 2]), size)
+        await cache.get_or_load("b", loader_of([1, 2]), size)
+        cache.peek("a")  # "b" is now the least recently used
+        await cache.get_or_load("c", loader_of([1, 2]), size)
+        self.assertIsNone(cache.peek("b"))
+        self.assertIsNotNone(cache.peek("a"))
+        self.assertIsNotNone(cache.peek("c"))
+        self.assertEqual(cache.weight, 4)
+
+    async def test_skips_values_heavier_than_the_cap(self):
+        cache = CatalogCache(max_weight=2)
+        await cache.get_or_load("big", loader_of([1, 2, 3]), len)
+        self.assertEqual(len(cache), 0)
+
+    async def test_concurrent_misses_share_one_load(self):
+        cache = CatalogCache()
+        calls = []
+        gate = asyncio.Event()
+        waiters = [asyncio.create_task(cache.get_or_load("k", loader_of("v", calls, gate))) for _ in range(5)]
+        await asyncio.sleep(0)
+        gate.set()
+        self.assertEqual(await asyncio.gather(*waiters), ["v"] * 5)
+        self.assertEqual(calls, ["v"])
+
+    async def test_a_load_racing_an_invalidate_is_not_cached(self):
+        cache = CatalogCache()
+        gate = asyncio.Event()
+        pending = asyncio.create_task(cache.get_or_load("k", loader_of("stale", gate=gate)))
+        await asyncio.sleep(0)
+        cache.invalidate()
+        gate.set()
+        self.assertEqual(await pending, "stale")
+        self.assertIsNone(cache.peek("k"))
+
+    async def test_failed_loads_are_not_cached(self):
+        cache = CatalogCache()
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            await cache.get_or_load("k", fail)
+        self.assertEqual(await cache.get_or_load("k", loader_of("v")), "v")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from unittest import mock
+
+import rate_limit
+from rate_limit import TokenBucketLimiter, client_key, parse_networks
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(rate_limit.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_allows_a_burst_then_throttles(self):
+        limiter = TokenBucketLimiter(rate=2, burst=3)
+        self.assertEqual([limiter.acquire("c") for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(limiter.acquire("c"), 0.5)
+
+    def test_refills_at_the_configured_rate(self):
+        limiter = TokenBucketLimiter(rate=2, burst=3)
+        for _ in range(3):
+            limiter.acquire("c")
+        self.clock.now += 0.5
+        self.assertEqual(limiter.acquire("c"), 0.0)
+        self.assertGreater(limiter.acquire("c"), 0)
+        self.clock.now += 60
+        # Refills never go past the burst size
+        self.assertEqual([limiter.acquire("c") for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertGreater(limiter.acquire("c"), 0)
+
+    def test_clients_have_separate_buckets(self):
+        limiter = TokenBucketLimiter(rate=1, burst=1)
+        self.assertEqual(limiter.acquire("a"), 0.0)
+        self.assertGreater(limiter.acquire("a"), 0)
+        self.assertEqual(limiter.acquire("b"), 0.0)
+
+    def test_evicts_the_least_recently_seen_client(self):
+        limiter = TokenBucketLimiter(rate=1, burst=1, max_clients=2)
+        for key in ("a", "b", "c"):
+            limiter.acquire(key)
+        self.assertEqual(len(limiter), 2)
+        # "a" was evicted and comes back with a full bucket
+        self.assertEqual(limiter.acquire("a"), 0.0)
+
+
+class ClientKeyTest(unittest.TestCase):
+    def scope(self, peer, real_ip=None):
+        headers = [(b"x-real-ip", real_ip.encode())] if real_ip else []
+        return {"client": (peer, 1234), "headers": headers}
+
+    def test_trusts_x_real_ip_only_from_trusted_proxies(self):
+        trusted = parse_networks("127.0.0.1/8,10.0.0.0/8")
+        self.assertEqual(client_key(self.scope("127.0.0.1", "8.8.8.8"), trusted), "8.8.8.8")
+        self.assertEqual(client_key(self.scope("10.1.2.3", "8.8.8.8"), trusted), "8.8.8.8")
+        self.assertEqual(client_key(self.scope("203.0.113.5", "8.8.8.8"), trusted), "203.0.113.5")
+        self.assertEqual(client_key(self.scope("127.0.0.1"), trusted), "127.0.0.1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from vote_buffer import VoteBuffer
+
+
+class FakeFormations:
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.writes = []
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.writes.append(operations)
+
+
+class VoteBufferTest(unittest.IsolatedAsyncioTestCase):
+    async def test_flush_writes_one_operation_per_formation(self):
+        formations = FakeFormations()
+        flushed_ids = []
+
+        async def on_flush(ids):
+            flushed_ids.extend(ids)
+
+        buffer = VoteBuffer(formations, max_pending=100, on_flush=on_flush)
+        for formation_id in ("a", "a", "b", "a"):
+            buffer.record(formation_id)
+        self.assertEqual(buffer.stats()["pending_votes"], 4)
+        self.assertEqual(await buffer.flush(), 4)
+        self.assertEqual(len(formations.writes), 1)
+        self.assertEqual(len(formations.writes[0]), 2)
+        self.assertEqual(sorted(flushed_ids), ["a", "b"])
+        self.assertEqual(buffer.stats()["pending_votes"], 0)
+        self.assertEqual(await buffer.flush(), 0)
+
+    async def test_requeues_everything_when_the_write_fails(self):
+        formations = FakeFormations(failures=[AutoReconnect("down")])
+        buffer = VoteBuffer(formations, max_pending=100)
+        buffer.record("a", 3)
+        buffer.record("b", 2)
+        self.assertEqual(await buffer.flush(), 0)
+        self.assertEqual(buffer.stats()["pending_votes"], 5)
+        self.assertEqual(buffer.stats()["pending_formations"], 2)
+        self.assertEqual(await buffer.flush(), 5)
+        self.assertEqual(buffer.flushed_votes, 5)
+
+    async def test_requeues_only_the_failed_operations(self):
+        buffer = VoteBuffer(FakeFormations(), max_pending=100)
+        buffer.record("a", 3)
+        buffer.record("b", 2)
+        # Operations follow insertion order, so index 1 is "b"
+        buffer.collection.failures.append(BulkWriteError({"writeErrors": [{"index": 1}]}))
+        self.assertEqual(await buffer.flush(), 3)
+        self.assertEqual(buffer.stats()["pending_votes"], 2)
+        self.assertEqual(buffer.stats()["pending_formations"], 1)
+
+    async def test_known_formations(self):
+        buffer = VoteBuffer(FakeFormations())
+        buffer.add_known("a", "Theme")
+        self.assertTrue(await buffer.exists("a"))
+        self.assertEqual(buffer.theme_of("a"), "Theme")
+        buffer.forget("a")
+        self.assertIsNone(buffer.theme_of("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
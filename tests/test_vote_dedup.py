@@ -0,0 +1,54 @@
+import unittest
+from unittest import mock
+
+import vote_dedup
+from vote_dedup import BloomFilter, DailyBloomFilter
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_added_keys_are_always_found(self):
+        bloom = BloomFilter(capacity=5000, error_rate=0.01)
+        keys = [f"client-{i}" for i in range(5000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+
+    def test_false_positive_rate_stays_near_the_target(self):
+        bloom = BloomFilter(capacity=5000, error_rate=0.01)
+        for i in range(5000):
+            bloom.add(f"in-{i}")
+        false_positives = sum(f"out-{i}" in bloom for i in range(20000))
+        self.assertLess(false_positives / 20000, 0.02)
+
+    def test_add_reports_repeats(self):
+        bloom = BloomFilter(capacity=100, error_rate=0.001)
+        self.assertTrue(bloom.add("a"))
+        self.assertFalse(bloom.add("a"))
+        self.assertEqual(bloom.count, 1)
+
+
+class DailyBloomFilterTest(unittest.TestCase):
+    def test_one_vote_per_client_and_formation(self):
+        dedup = DailyBloomFilter(capacity=1000)
+        self.assertFalse(dedup.seen("1.2.3.4", "f1"))
+        self.assertTrue(dedup.add("1.2.3.4", "f1"))
+        self.assertTrue(dedup.seen("1.2.3.4", "f1"))
+        self.assertFalse(dedup.add("1.2.3.4", "f1"))
+        self.assertTrue(dedup.add("1.2.3.4", "f2"))
+        self.assertTrue(dedup.add("5.6.7.8", "f1"))
+        self.assertEqual(dedup.stats()["votes_today"], 3)
+
+    def test_starts_empty_on_a_new_utc_day(self):
+        dedup = DailyBloomFilter(capacity=1000)
+        day = 20000 * vote_dedup.SECONDS_PER_DAY
+        with mock.patch.object(vote_dedup.time, "time", return_value=day + 86399):
+            dedup.add("c", "f")
+            self.assertTrue(dedup.seen("c", "f"))
+        with mock.patch.object(vote_dedup.time, "time", return_value=day + 86400):
+            self.assertFalse(dedup.seen("c", "f"))
+            self.assertTrue(dedup.add("c", "f"))
+            self.assertEqual(dedup.stats()["votes_today"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()